@@ -0,0 +1,148 @@
+import queue
+import threading
+import time
+from collections import namedtuple
+
+from crossing import CrossingDetector
+
+# Latest state published by the acquisition thread. Replaced as a whole, so readers never see a partial update.
+Snapshot = namedtuple("Snapshot", ["envelope", "threshold", "samples", "timestamp"])
+
+
+def update_baseline(phase, emg_filter, index: int = None):
+    """
+    Marks the filtered signal as baseline during the Relax phase and computes the baseline once the MotorTask starts.
+    :param index: Sample the phase applies to, defaults to the end of the filter output
+    """
+    if phase == "Relax":
+        emg_filter.mark_as_baseline(index)
+    elif phase == "MotorTask":
+        emg_filter.mark_as_NOT_baseline(index)
+        emg_filter.reset_baseline()
+
+
+def get_threshold(emg_filter, deviations: float = 3):
+    """
+    :return: Threshold the given no. of standard deviations above the baseline, or None if there is no baseline yet
+    """
+    if emg_filter.baseline is None:
+        return None
+    return emg_filter.baseline + emg_filter.baseline_std * deviations
+
+
+def detect_crossings(detector: CrossingDetector, output, timestamps, emg_filter):
+    """
+    :return: Crossings of the threshold in the filtered block, re-armed 1 standard deviation below the threshold
+    """
+    return detector.detect(output, timestamps, get_threshold(emg_filter), get_threshold(emg_filter, 2))
+
+
+def publish(publisher, emg_filter, output, timestamps):
+    """
+    Writes the newly filtered samples, the raw samples of the first channel and the threshold to a `StreamPublisher`.
+    """
+    raw = emg_filter.input.last(len(output))
+    publisher.write(output, raw[0] if raw.ndim > 1 else raw, timestamps)
+    publisher.set_state(get_threshold(emg_filter), emg_filter.baseline, emg_filter.baseline_std)
+
+
+class Acquisition:
+    """
+    Polls the board and filters the signal on a background thread at a fixed cadence, independently of rendering.
+    The render loop only reads the latest `Snapshot`, takes the threshold crossings from `crossings` and reports the
+    current phase back through `phase`.
+    """
+
+    def __init__(self, get_input, emg_filter, get_timestamps=None, interval: float = 0.01, latency=None,
+                 publisher=None, refractory: float = 0):
+        """
+        :param get_input: Function returning the new data from the board or None, e.g. `Flow.get_user_input`
+        :param emg_filter: `Filter` or `FilterBank` owned by the acquisition thread while it runs
+        :param get_timestamps: Function returning the timestamps of the new data, e.g. `Flow.get_timestamps`
+        :param interval: Seconds between two polls
+        :param latency: `LatencyTracker` to record the acquisition and filter latencies with
+        :param publisher: `StreamPublisher` to publish the filtered signal to
+        :param refractory: Minimum no. of seconds between two crossings
+        """
+        self.get_input = get_input
+        self.emg_filter = emg_filter
+        self.get_timestamps = get_timestamps
+        self.interval = interval
+        self.latency = latency
+        self.publisher = publisher
+        self.detector = CrossingDetector(emg_filter.fs, refractory)
+        self.crossings = queue.SimpleQueue()
+
+        # Written by the render loop, read by the acquisition thread
+        self.phase = None
+
+        self.latest = Snapshot(None, None, 0, None)
+        self.error = None
+
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="acquisition", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+
+    def read(self):
+        """
+        :return: The latest published `Snapshot`
+        """
+        if self.error is not None:
+            raise self.error
+        return self.latest
+
+    def read_crossings(self):
+        """
+        :return: List of the crossings detected since the last call
+        """
+        crossings = []
+        while not self.crossings.empty():
+            crossings.append(self.crossings.get())
+        return crossings
+
+    def poll(self):
+        emg = self.get_input()
+        output = None
+        timestamps = None
+        if emg is not None:
+            timestamps = self.get_timestamps() if self.get_timestamps is not None else None
+            if self.latency is not None:
+                self.latency.samples("acquired", timestamps)
+            output = self.emg_filter.apply_block(emg)
+        update_baseline(self.phase, self.emg_filter)
+        if output is not None:
+            if self.latency is not None:
+                self.latency.block("filtered", timestamps)
+            if self.publisher is not None:
+                publish(self.publisher, self.emg_filter, output, timestamps)
+            for crossing in detect_crossings(self.detector, output, timestamps, self.emg_filter):
+                self.crossings.put(crossing)
+
+        try:
+            envelope = self.emg_filter.output[-1]
+        except IndexError:
+            envelope = None
+        self.latest = Snapshot(envelope, get_threshold(self.emg_filter), len(self.emg_filter.output), time.monotonic())
+
+    def _run(self):
+        next_poll = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                self.error = e
+                return
+
+            next_poll += self.interval
+            delay = next_poll - time.monotonic()
+            if delay > 0:
+                self._stop_event.wait(delay)
+            else:
+                # Running late, don't try to catch up with a burst of polls
+                next_poll = time.monotonic()
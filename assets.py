@@ -0,0 +1,78 @@
+import threading
+
+import pygame
+
+
+def _tint(original, colour):
+    surf = original.copy()
+    surf.fill((0, 0, 0, 255), None, pygame.BLEND_RGBA_MULT)
+    surf.fill(colour + (0,), None, pygame.BLEND_RGBA_ADD)
+    return surf
+
+
+class AssetCache:
+    """
+    Loads every image once and keeps it converted to the pixel format of the display, so that blitting it doesn't
+    need a conversion every frame. Images are keyed by their path, target size and tint.
+    """
+
+    def __init__(self):
+        self._surfaces = {}
+        self._lock = threading.Lock()
+        self._preload_thread = None
+
+    def get(self, path: str, size: tuple = None, tint: tuple = None):
+        """
+        :param path: Path of the image
+        :param size: Size to scale the image to, or None to keep the original size
+        :param tint: Colour to tint the image with, or None to keep the original colours
+        :return: The cached surface
+        """
+        # Don't load the same image twice while it's being preloaded
+        if self._preload_thread is not None and self._preload_thread is not threading.current_thread():
+            self._preload_thread.join()
+            self._preload_thread = None
+
+        key = (path, tuple(size) if size is not None else None, tuple(tint) if tint is not None else None)
+        with self._lock:
+            surface = self._surfaces.get(key)
+        if surface is not None:
+            return surface
+
+        if tint is not None:
+            surface = _tint(self.get(path, size), tint)
+        elif size is not None:
+            surface = pygame.transform.scale(self.get(path), size)
+        else:
+            surface = self._convert(pygame.image.load(path))
+
+        with self._lock:
+            self._surfaces[key] = surface
+        return surface
+
+    def preload(self, keys):
+        """
+        Starts loading the images on a background thread. `get` waits for the preloading to finish.
+        :param keys: Iterable of `(path, size, tint)` tuples to load
+        """
+        keys = list(keys)
+        self._preload_thread = threading.Thread(target=lambda: [self.get(*key) for key in keys], name="preload",
+                                                daemon=True)
+        self._preload_thread.start()
+
+    def clear(self):
+        with self._lock:
+            self._surfaces.clear()
+
+    @staticmethod
+    def _convert(surface):
+        # Images can only be converted once the display mode is set
+        if pygame.display.get_surface() is None:
+            return surface
+        if surface.get_flags() & pygame.SRCALPHA or surface.get_colorkey() is not None:
+            return surface.convert_alpha()
+        return surface.convert()
+
+
+# Shared by all the scenes
+assets = AssetCache()
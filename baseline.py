@@ -0,0 +1,85 @@
+import numpy as np
+
+from ring_buffer import RingBuffer
+
+
+class BaselineEstimator:
+    """
+    Streaming estimate of the mean and the standard deviation of a signal, updated block by block with running sums.
+    Either over a sliding window of the last samples, or over all the samples with exponential forgetting.
+    """
+
+    def __init__(self, window: int, shape: tuple = (), half_life: float = None, min_samples: int = None):
+        """
+        :param window: Number of samples of the sliding window
+        :param shape: Shape of the leading axes, e.g. `(channels,)` to estimate every channel separately
+        :param half_life: If set, the samples are weighted by their age instead, halving every `half_life` samples
+        :param min_samples: Number of samples needed before the estimate is ready. Default is the window size.
+        """
+        self.window = int(window)
+        self.shape = tuple(shape)
+        self.half_life = half_life
+        self.min_samples = self.window if min_samples is None else min_samples
+        self.decay = 0.5 ** (1 / half_life) if half_life else None
+
+        self._samples = RingBuffer(self.window, shape=self.shape) if half_life is None else None
+        self.count = 0
+        self._shift = None
+        self._weight = 0.0
+        self._sum = np.zeros(self.shape)
+        self._sum_squares = np.zeros(self.shape)
+
+    @property
+    def ready(self):
+        return self.count >= self.min_samples
+
+    @property
+    def mean(self):
+        if self._weight == 0:
+            return None
+        return self._shift + self._sum / self._weight
+
+    @property
+    def std(self):
+        if self._weight == 0:
+            return None
+        mean = self._sum / self._weight
+        return np.sqrt(np.maximum(self._sum_squares / self._weight - mean ** 2, 0))
+
+    def update(self, block):
+        """
+        :param block: New samples with time on the last axis
+        """
+        block = np.asarray(block, dtype=float)
+        n = block.shape[-1]
+        if n == 0:
+            return
+        # Summing values relative to the first sample keeps the variance numerically stable
+        if self._shift is None:
+            self._shift = block[..., 0].copy()
+        x = block - self._shift[..., np.newaxis]
+        self.count += n
+
+        if self.decay is not None:
+            weights = self.decay ** np.arange(n - 1, -1, -1)
+            decay = self.decay ** n
+            self._weight = decay * self._weight + weights.sum()
+            self._sum = decay * self._sum + (x * weights).sum(axis=-1)
+            self._sum_squares = decay * self._sum_squares + (x ** 2 * weights).sum(axis=-1)
+            return
+
+        if n >= self.window:
+            x = x[..., -self.window:]
+            self._sum = x.sum(axis=-1)
+            self._sum_squares = (x ** 2).sum(axis=-1)
+        else:
+            retained = min(len(self._samples), self.window)
+            leaving = max(0, retained + n - self.window)
+            if leaving:
+                old = self._samples.last(retained)[..., :leaving]
+                self._sum = self._sum - old.sum(axis=-1)
+                self._sum_squares = self._sum_squares - (old ** 2).sum(axis=-1)
+            self._sum = self._sum + x.sum(axis=-1)
+            self._sum_squares = self._sum_squares + (x ** 2).sum(axis=-1)
+        self._samples.append(x)
+        self._weight = min(len(self._samples), self.window)
@@ -0,0 +1,233 @@
+import argparse
+import csv
+import glob
+import itertools
+import os
+import re
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from acquisition import update_baseline
+from epochs import read_events, read_recording, to_samples
+from filter import Filter
+from replay import replay_file
+
+Session = namedtuple("Session", ["name", "mode", "emg", "interaction"])
+Parameters = namedtuple("Parameters", ["bandpass_low", "bandpass_high", "mean_kernel_size"])
+
+SESSION_FORMAT = "%Y-%m-%d-%H-%M-%S"
+EMG_PATTERN = re.compile(r"(\d{4}-\d{2}-\d{2}-\d{2}-\d{2}-\d{2})_(game|instructions)\.(csv|bcirec)$")
+INTERACTION_PATTERN = re.compile(r"(\d{4}-\d{2}-\d{2}-\d{2}-\d{2}-\d{2})-interaction\.csv$")
+
+
+def find_sessions(directory: str, max_gap: float = 60):
+    """
+    Pairs every EMG recording in the directory with the interaction log started closest to it.
+    :param directory: Directory with the logs, e.g. "logs"
+    :param max_gap: Maximum number of seconds between the start of the recording and of the interaction log
+    :return: List of `Session`s, `interaction` is None if no interaction log matches
+    """
+    interactions = []
+    for path in glob.glob(os.path.join(directory, "*-interaction.csv")):
+        match = INTERACTION_PATTERN.search(path)
+        if match:
+            interactions.append((datetime.strptime(match.group(1), SESSION_FORMAT), path))
+
+    sessions = []
+    for path in sorted(glob.glob(os.path.join(directory, "*_*.*"))):
+        match = EMG_PATTERN.search(path)
+        if not match:
+            continue
+        started = datetime.strptime(match.group(1), SESSION_FORMAT)
+        interaction = None
+        if interactions:
+            gap, interaction = min((abs((other - started).total_seconds()), other_path)
+                                   for other, other_path in interactions)
+            if gap > max_gap:
+                interaction = None
+        sessions.append(Session(name=match.group(1), mode=match.group(2), emg=path, interaction=interaction))
+    return sessions
+
+
+def read_interactions(path: str):
+    """
+    :return: List of `(datetime, type, value)` events of an interaction log
+    """
+    events = []
+    with open(path) as f:
+        next(f)  # header
+        for line in f:
+            fields = line.rstrip("\n").split(";")
+            if len(fields) < 3:
+                continue
+            events.append((datetime.fromisoformat(fields[0]), fields[1], fields[2]))
+    return events
+
+
+def interaction_metrics(events):
+    """
+    :return: Logged jumps, hits, seconds spent in each phase and the second of the recording at which the game started
+    """
+    metrics = {"jumps": 0, "hits": 0}
+    emg_start = None
+    game_start = None
+    phase, phase_start = None, None
+    for timestamp, type_, value in events:
+        if type_ == "EMGstart":
+            emg_start = timestamp
+        elif type_ == "PlayerJump":
+            metrics["jumps"] += 1
+        elif type_ == "PlayerHit":
+            metrics["hits"] += 1
+        elif type_ == "Phase":
+            if phase is not None:
+                key = f"time_{phase}"
+                metrics[key] = metrics.get(key, 0) + (timestamp - phase_start).total_seconds()
+            if game_start is None and value != "NotRunning":
+                game_start = timestamp
+            phase, phase_start = value, timestamp
+    # The last phase lasts until the last logged event
+    if phase is not None and events:
+        key = f"time_{phase}"
+        metrics[key] = metrics.get(key, 0) + (events[-1][0] - phase_start).total_seconds()
+
+    start = 0
+    if emg_start is not None and game_start is not None:
+        start = max((game_start - emg_start).total_seconds(), 0)
+    return metrics, start
+
+
+def logged_baselines(session: Session, parameters: Parameters, sampling_rate: int = 250, channel: int = 1,
+                     envelope=None):
+    """
+    Runs a recording through the filter and estimates the baseline from the Relax phases logged in its interaction
+    log, i.e. from the phases the subject actually went through.
+    :param envelope: Output of the filter for the whole recording if it has been filtered already, e.g. by the replay
+    :return: List of `(second, baseline, baseline standard deviation)` at the end of every Relax phase, and the
+    number of seconds of the recording
+    """
+    data, timestamps = read_recording(session.emg, [channel])
+    duration = data.shape[1] / sampling_rate
+    emg_filter = Filter(sampling_frequency=sampling_rate, bandpass_low=parameters.bandpass_low,
+                        bandpass_high=parameters.bandpass_high, mean_kernel_size=parameters.mean_kernel_size,
+                        retention=duration + 1)
+    if envelope is None:
+        emg_filter.apply_block(data[0])
+    else:
+        # The baseline is only estimated from the output, which doesn't have to be filtered again
+        emg_filter.output.append(envelope)
+
+    events = read_events(session.interaction)
+    phase = events.types == "Phase"
+    baselines = []
+    previous = None
+    for onset, name in zip(to_samples(timestamps, events.times[phase]).tolist(), events.values[phase].tolist()):
+        # Any phase after Relax ends the baseline, also the Prepare phase of the instructions
+        update_baseline("Relax" if name == "Relax" else "MotorTask", emg_filter, onset)
+        if previous == "Relax" and name != "Relax" and emg_filter.baseline is not None:
+            baselines.append((onset / sampling_rate, emg_filter.baseline, emg_filter.baseline_std))
+        previous = name
+    emg_filter.close()
+    return baselines, duration
+
+
+def analyze_session(session: Session, parameters: Parameters, sampling_rate: int = 250, channel: int = 1):
+    """
+    Runs one session through the filter and the threshold logic. The baseline is estimated from the logged phases if
+    the session has an interaction log. Only game sessions are replayed through the game, the jumps and hits of the
+    replay are left out for the instructions.
+    :return: Dictionary with the metrics of the session
+    """
+    row = {"session": session.name, "mode": session.mode}
+    row.update(parameters._asdict())
+
+    start = 0
+    if session.interaction is not None:
+        metrics, start = interaction_metrics(read_interactions(session.interaction))
+        row.update(metrics)
+
+    envelope = None
+    baselines = None
+    if session.mode == "game":
+        result = replay_file(session.emg, sampling_rate=sampling_rate, channel=channel,
+                             bandpass_low=parameters.bandpass_low, bandpass_high=parameters.bandpass_high,
+                             mean_kernel_size=parameters.mean_kernel_size, start=start)
+        # The recording is filtered once, the logged baselines are estimated from the envelope of the replay
+        envelope = result.envelope
+        row["duration"] = len(envelope) / sampling_rate
+        # Without a log, the phases of the simulated game are all there is
+        baselines = result.baselines
+        row["replay_jumps"] = len(result.jumps)
+        row["replay_hits"] = len(result.hits)
+
+    if session.interaction is not None:
+        baselines, row["duration"] = logged_baselines(session, parameters, sampling_rate, channel, envelope)
+    elif baselines is None:
+        row["duration"] = read_recording(session.emg, [channel])[0].shape[1] / sampling_rate
+
+    if baselines:
+        row["baseline_mean"] = float(np.mean([mean for _, mean, _ in baselines]))
+        row["baseline_std"] = float(np.mean([std for _, _, std in baselines]))
+    return row
+
+
+def _analyze(task):
+    return analyze_session(*task)
+
+
+def analyze(sessions, parameters, sampling_rate: int = 250, channel: int = 1, workers: int = None):
+    """
+    Analyzes every combination of a session and parameters on a pool of processes.
+    :return: List of rows, one per session and parameters
+    """
+    tasks = [(session, params, sampling_rate, channel) for params in parameters for session in sessions]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Recordings differ a lot in length, small chunks keep all the workers busy
+        return list(executor.map(_analyze, tasks, chunksize=1))
+
+
+def write_summary(rows, path: str):
+    columns = []
+    for row in rows:
+        columns.extend(column for column in row if column not in columns)
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns, delimiter=";")
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Analyze a directory of recorded sessions")
+    arg_parser.add_argument("directory", nargs="?", default="logs", help="Directory with the sessions. Default is logs")
+    arg_parser.add_argument("--output", default="summary.csv", help="Summary table to write. Default is summary.csv")
+    arg_parser.add_argument("--channel", type=int, default=1, help="no. of the EMG channel. Default is 1")
+    arg_parser.add_argument("--sampling-rate", type=int, default=250, help="Sampling rate in Hz. Default is 250")
+    arg_parser.add_argument("--bandpass-low", type=int, nargs="+", default=[30],
+                            help="Low cuts in Hz to sweep over. Default is 30")
+    arg_parser.add_argument("--bandpass-high", type=int, nargs="+", default=[45],
+                            help="High cuts in Hz to sweep over. Default is 45")
+    arg_parser.add_argument("--kernel", type=int, nargs="+", default=[None],
+                            help="Mean filter kernel sizes in samples to sweep over. Default is a third of a second")
+    arg_parser.add_argument("--workers", type=int, default=None, help="Number of processes. Default is all CPUs")
+    args = arg_parser.parse_args()
+
+    sessions = find_sessions(args.directory)
+    if not sessions:
+        print(f"No sessions found in {args.directory}")
+        return
+    parameters = [Parameters(*combination) for combination in
+                  itertools.product(args.bandpass_low, args.bandpass_high, args.kernel)]
+    print(f"Analyzing {len(sessions)} sessions with {len(parameters)} parameter combinations")
+
+    rows = analyze(sessions, parameters, sampling_rate=args.sampling_rate, channel=args.channel, workers=args.workers)
+    write_summary(rows, args.output)
+    for row in rows:
+        print("; ".join(f"{key}={value}" for key, value in row.items()))
+    print(f"Summary written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+# Render without a window, must be set before pygame is initialised
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import numpy as np
+import pygame
+
+from acquisition import detect_crossings
+from crossing import CrossingDetector
+from envelope import DETECTORS, create_detector
+from filter import Filter, FilterBank
+from game_scene import GameScene, preload_assets
+from instructions_scene import InstructionScene
+from main import adapt_threshold
+from recording import read_chunks
+
+SAMPLING_RATE = 250
+CHANNEL = 1
+WINDOW_SIZES = [(800, 600), (1280, 720), (1920, 1080)]
+
+
+def load_example(path: str):
+    """
+    :return: Board data of the whole recording (channels x samples)
+    """
+    return np.concatenate(list(read_chunks(path)), axis=1)
+
+
+def create_filter():
+    return Filter(sampling_frequency=SAMPLING_RATE, bandpass_low=30, bandpass_high=45)
+
+
+def measure(function, repeat: int):
+    """
+    :param function: Function running the benchmark once and returning the number of processed items
+    :return: Items per second of the best and of the median run
+    """
+    rates = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        items = function()
+        rates.append(items / (time.perf_counter() - started))
+    return max(rates), statistics.median(rates)
+
+
+def bench_filter_apply(data):
+    emg_filter = create_filter()
+    for sample in data[CHANNEL]:
+        emg_filter.apply(sample)
+    return data.shape[1]
+
+
+def bench_filter_apply_block(data, block_size):
+    emg_filter = create_filter()
+    channel = data[CHANNEL]
+    for start in range(0, len(channel), block_size):
+        emg_filter.apply_block(channel[start:start + block_size])
+    return data.shape[1]
+
+
+def bench_filter_bank(data, block_size, channels=(1, 2, 3, 4)):
+    emg_filter = FilterBank(channels=list(channels), sampling_frequency=SAMPLING_RATE, bandpass_low=30,
+                            bandpass_high=45)
+    for start in range(0, data.shape[1], block_size):
+        emg_filter.apply_block(data[:, start:start + block_size])
+    return data.shape[1]
+
+
+def bench_envelope(data, name, block_size):
+    detector = create_detector(name, SAMPLING_RATE)
+    channel = data[CHANNEL]
+    for start in range(0, len(channel), block_size):
+        detector.apply_block(channel[start:start + block_size])
+    return data.shape[1]
+
+
+def frame_clock(fps: int = 60):
+    """
+    :return: Clock for `GameScene.clock` that advances by one frame every time it is read, so that the game moves as
+    in a session at that frame rate however fast the frames are drawn
+    """
+    frames = itertools.count()
+    return lambda: next(frames) / fps
+
+
+def bench_scene(scene, frames):
+    screen = pygame.display.get_surface()
+    for _ in range(frames):
+        scene.draw(screen, None)
+    return frames
+
+
+def bench_loop(data, frames):
+    """
+    Simulates the main loop of the game without waiting for the clock: every frame takes the samples of 1/60 s,
+    filters them, updates the threshold, detects the crossings and draws the scene 1/60 s later on the game clock.
+    Stops at the end of the recording.
+    """
+    screen = pygame.display.get_surface()
+    scene = GameScene()
+    scene.clock = frame_clock()
+    scene.started = True
+    emg_filter = create_filter()
+    detector = CrossingDetector(SAMPLING_RATE)
+    channel = data[CHANNEL]
+    timestamps = data[22]
+    frames = min(frames, len(channel) * 60 // SAMPLING_RATE)
+    for frame in range(frames):
+        start, stop = frame * SAMPLING_RATE // 60, (frame + 1) * SAMPLING_RATE // 60
+        output = emg_filter.apply_block(channel[start:stop])
+        adapt_threshold(scene, emg_filter)
+        for crossing in detect_crossings(detector, output, timestamps[start:stop], emg_filter):
+            scene.process_crossing(crossing)
+        scene.draw(screen, emg_filter.output[-1] if len(emg_filter.output) else None)
+    scene.close()
+    return frames
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(path: str, repeat: int = 3, frames: int = 300):
+    """
+    Runs all the benchmarks.
+    :param path: Recording to filter
+    :param repeat: Number of runs of every benchmark
+    :param frames: Number of frames of the rendering benchmarks
+    :return: List of results, each with the name, the parameters, the unit and the best and median rate
+    """
+    data = load_example(path)
+    results = []
+
+    def record(name, params, unit, function):
+        best, median = measure(function, repeat)
+        results.append({"name": name, "params": params, "unit": unit, "best": round(best, 1),
+                        "median": round(median, 1)})
+        print(f"{name:20} {json.dumps(params):36} {median:12.1f} {unit}", file=sys.stderr)
+
+    record("filter_apply", {}, "samples/s", lambda: bench_filter_apply(data))
+    for block_size in [1, 4, 250]:
+        record("filter_apply_block", {"block_size": block_size}, "samples/s",
+               lambda: bench_filter_apply_block(data, block_size))
+    record("filter_bank", {"block_size": 4, "channels": 4}, "samples/s", lambda: bench_filter_bank(data, 4))
+    for name in DETECTORS:
+        record("envelope", {"detector": name, "block_size": 4}, "samples/s", lambda: bench_envelope(data, name, 4))
+
+    pygame.init()
+    os.makedirs("logs", exist_ok=True)
+    for size in WINDOW_SIZES:
+        pygame.display.set_mode(size)
+        preload_assets()
+        params = {"width": size[0], "height": size[1]}
+
+        def game():
+            scene = GameScene()
+            scene.clock = frame_clock()
+            scene.started = True
+            try:
+                return bench_scene(scene, frames)
+            finally:
+                scene.close()
+
+        def instructions():
+            scene = InstructionScene()
+            scene.timing_task.start()
+            try:
+                return bench_scene(scene, frames)
+            finally:
+                scene.close()
+
+        record("game_draw", params, "frames/s", game)
+        record("instructions_draw", params, "frames/s", instructions)
+    pygame.display.set_mode(WINDOW_SIZES[0])
+    record("loop", {"width": WINDOW_SIZES[0][0], "height": WINDOW_SIZES[0][1]}, "frames/s",
+           lambda: bench_loop(data, frames))
+    pygame.quit()
+    return results
+
+
+def compare(results, baseline):
+    """
+    Prints the change of the median rate of every benchmark against the results of an earlier run.
+    :param baseline: Report written by an earlier run
+    """
+    previous = {(result["name"], json.dumps(result["params"], sort_keys=True)): result for result in baseline["results"]}
+    print(f"Compared to {baseline.get('commit')}:", file=sys.stderr)
+    for result in results:
+        before = previous.get((result["name"], json.dumps(result["params"], sort_keys=True)))
+        if before is None or not before["median"]:
+            continue
+        change = result["median"] / before["median"] - 1
+        print(f"{result['name']:20} {json.dumps(result['params']):36} {change:+8.1%}", file=sys.stderr)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark the filter, the scenes and the main loop without a "
+                                                     "window")
+    arg_parser.add_argument("--file", default="examples/example_5.csv",
+                            help="Recording to filter. Default is examples/example_5.csv")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="Number of runs of every benchmark. Default is 3")
+    arg_parser.add_argument("--frames", type=int, default=300,
+                            help="Number of frames of the rendering benchmarks. Default is 300")
+    arg_parser.add_argument("--output", default=None, help="Write the results to this .json file instead of stdout")
+    arg_parser.add_argument("--compare", default=None, help="Compare the results to a .json file of an earlier run")
+    args = arg_parser.parse_args()
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pygame": pygame.version.ver,
+        "platform": platform.platform(),
+        "file": args.file,
+        "repeat": args.repeat,
+        "results": run(args.file, repeat=args.repeat, frames=args.frames),
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report["results"], json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+from collections import namedtuple
+
+import numpy as np
+
+# Upward crossing of the threshold: absolute sample index, BrainFlow timestamp of the sample and the filtered value
+Crossing = namedtuple("Crossing", ["index", "timestamp", "value"])
+
+
+class CrossingDetector:
+    """
+    Finds every upward crossing of the threshold in a block of the filtered signal, not only in the last sample of a
+    frame. After a crossing, the signal has to fall below the release level before it can cross again (hysteresis),
+    and crossings closer than the refractory period to the previous one are ignored.
+    """
+
+    def __init__(self, sampling_frequency: int, refractory: float = 0):
+        """
+        :param sampling_frequency: Sampling frequency of the signal in Hz
+        :param refractory: Minimum number of seconds between two crossings, e.g. the duration of a step of the game,
+        which can't act on more than one crossing per step. Penalties of the game after a crossing are up to the game
+        """
+        self.refractory = int(refractory * sampling_frequency)
+        self.samples = 0
+        self.armed = True
+        self.last_crossing = None
+        self._previous_above = False
+
+    def detect(self, block, timestamps=None, threshold=None, release=None):
+        """
+        :param block: New samples of the filtered signal
+        :param timestamps: BrainFlow timestamps of the samples
+        :param threshold: Level the signal has to cross, no crossings are detected if None
+        :param release: Level the signal has to fall below to re-arm the detector, defaults to the threshold
+        :return: List of `Crossing`s in the block
+        """
+        block = np.asarray(block)
+        n = len(block)
+        start = self.samples
+        self.samples += n
+        if n == 0:
+            return []
+        if threshold is None:
+            self._previous_above = False
+            self.armed = True
+            return []
+        if release is None:
+            release = threshold
+
+        above = block > threshold
+        rising = np.flatnonzero(above & ~np.concatenate(([self._previous_above], above[:-1])))
+        below = np.flatnonzero(block < release)
+        self._previous_above = bool(above[-1])
+
+        crossings = []
+        # Only the few rising edges are visited one by one, the samples are handled vectorized
+        last = -1
+        for i in rising.tolist():
+            if not self.armed:
+                # Re-armed if the signal fell below the release level since the last crossing
+                j = np.searchsorted(below, last + 1)
+                self.armed = j < len(below) and below[j] < i
+            if not self.armed:
+                continue
+            index = start + i
+            if self.last_crossing is not None and index - self.last_crossing < self.refractory:
+                continue
+            crossings.append(Crossing(index, timestamps[i] if timestamps is not None else None, block[i]))
+            self.last_crossing = index
+            self.armed = False
+            last = i
+        if not self.armed:
+            self.armed = bool(len(below)) and below[-1] > last
+        return crossings
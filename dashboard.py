@@ -0,0 +1,195 @@
+import argparse
+import time
+
+import numpy as np
+from matplotlib.patches import Rectangle
+
+from ring_buffer import RingBuffer
+from shm_stream import DEFAULT_NAME, StreamReader
+
+PHASE_COLOURS = {"Prepare": "#e7e162", "Relax": "#62e762", "MotorTask": "#62e1e7", "NotRunning": "#888888"}
+MAX_MARKERS = 16
+
+
+class Dashboard:
+    """
+    Scrolling plot of the raw signal, the envelope, the baseline ±3σ band, the threshold and the phase changes of a
+    live stream. Only the changing artists are redrawn and blitted onto a cached background; the axes are redrawn in
+    full only when the signal leaves the y limits.
+    """
+
+    def __init__(self, reader: StreamReader, window: float = 10, figure=None):
+        """
+        :param reader: Stream to plot
+        :param window: Number of seconds shown
+        :param figure: Figure to draw into, defaults to a new pyplot figure
+        """
+        if figure is None:
+            import matplotlib.pyplot as plt
+            figure = plt.figure("BCI calibration dashboard", figsize=(10, 6))
+        self.reader = reader
+        self.fs = reader.sampling_rate
+        self.window = int(window * self.fs)
+        self.figure = figure
+
+        self.envelope = RingBuffer(self.window)
+        self.raw = RingBuffer(self.window)
+        self.markers = []  # (sample, phase)
+        self.phase = None
+
+        self.raw_axes, self.envelope_axes = figure.subplots(2, 1, sharex=True)
+        self.raw_axes.set_ylabel("Raw")
+        self.envelope_axes.set_ylabel("Envelope")
+        self.envelope_axes.set_xlabel("Time / s")
+        self.raw_axes.set_xlim(-window, 0)
+        self.time = np.arange(-self.window + 1, 1) / self.fs
+
+        self.raw_line, = self.raw_axes.plot([], [], linewidth=0.5, animated=True)
+        self.envelope_line, = self.envelope_axes.plot([], [], linewidth=1, animated=True)
+        self.band = Rectangle((-window, 0), window, 0, color="#62e762", alpha=0.2, animated=True)
+        self.envelope_axes.add_patch(self.band)
+        self.threshold_line = self.envelope_axes.axhline(0, color="#e76262", linewidth=1, animated=True)
+        self.marker_lines = [self.envelope_axes.axvline(0, linestyle="--", linewidth=1, animated=True, visible=False)
+                             for _ in range(MAX_MARKERS)]
+        self.marker_labels = [self.envelope_axes.text(0, 1, "", transform=self.envelope_axes.get_xaxis_transform(),
+                                                      fontsize=8, va="top", animated=True, visible=False)
+                              for _ in range(MAX_MARKERS)]
+        self.artists = [self.raw_line, self.envelope_line, self.band, self.threshold_line] + self.marker_lines + \
+            self.marker_labels
+
+        self._background = None
+        figure.canvas.mpl_connect("draw_event", self._on_draw)
+
+    def _on_draw(self, _event):
+        self._background = self.figure.canvas.copy_from_bbox(self.figure.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        for artist in self.artists:
+            self.figure.draw_artist(artist)
+
+    def poll(self):
+        """
+        Takes all the samples published since the last poll.
+        :return: Number of new samples
+        """
+        block = self.reader.read()
+        n = len(block.envelope)
+        self.envelope.append(block.envelope)
+        self.raw.append(block.raw)
+        phase = self.reader.state().phase
+        if phase != self.phase:
+            self.markers.append((len(self.envelope), phase))
+            self.markers = self.markers[-MAX_MARKERS:]
+            self.phase = phase
+        return n
+
+    def _rescale(self, axes, values, low=None, high=None):
+        """
+        :return: True if the y limits had to change to fit the values
+        """
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return False
+        low = values.min() if low is None else min(values.min(), low)
+        high = values.max() if high is None else max(values.max(), high)
+        bottom, top = axes.get_ylim()
+        if bottom <= low and high <= top and (high - low) > 0.25 * (top - bottom):
+            return False
+        margin = 0.1 * (high - low) or 1
+        axes.set_ylim(low - margin, high + margin)
+        return True
+
+    def update(self):
+        """
+        Updates the artists with the latest window and blits them, redrawing everything if the limits changed.
+        """
+        count = len(self.envelope)
+        n = min(count, self.window)
+        envelope = self.envelope.last(n)
+        raw = self.raw.last(n)
+        t = self.time[self.window - n:]
+        self.raw_line.set_data(t, raw)
+        self.envelope_line.set_data(t, envelope)
+
+        state = self.reader.state()
+        low = high = None
+        if state.baseline is not None and state.baseline_std is not None:
+            low, high = state.baseline - 3 * state.baseline_std, state.baseline + 3 * state.baseline_std
+            self.band.set_y(low)
+            self.band.set_height(high - low)
+            self.band.set_visible(True)
+        else:
+            self.band.set_visible(False)
+        if state.threshold is not None:
+            self.threshold_line.set_ydata([state.threshold, state.threshold])
+            self.threshold_line.set_visible(True)
+            high = state.threshold if high is None else max(high, state.threshold)
+        else:
+            self.threshold_line.set_visible(False)
+
+        markers = [(sample, phase) for sample, phase in self.markers if count - sample < self.window and phase]
+        for i, (line, label) in enumerate(zip(self.marker_lines, self.marker_labels)):
+            if i < len(markers):
+                sample, phase = markers[i]
+                x = (sample - count) / self.fs
+                line.set_xdata([x, x])
+                line.set_color(PHASE_COLOURS.get(phase, "black"))
+                label.set_x(x)
+                label.set_text(phase)
+            line.set_visible(i < len(markers))
+            label.set_visible(i < len(markers))
+
+        rescaled = self._rescale(self.raw_axes, raw)
+        rescaled = self._rescale(self.envelope_axes, envelope, low, high) or rescaled
+        canvas = self.figure.canvas
+        if rescaled or self._background is None:
+            # Redraws the axes and captures the new background in `_on_draw`
+            canvas.draw()
+        else:
+            canvas.restore_region(self._background)
+            self._draw_artists()
+            canvas.blit(self.figure.bbox)
+        canvas.flush_events()
+
+    def run(self, fps: float = 30):
+        """
+        Updates the plot until the stream is closed or the window is closed.
+        """
+        import matplotlib.pyplot as plt
+
+        plt.show(block=False)
+        interval = 1 / fps
+        while plt.fignum_exists(self.figure.number) and not self.reader.closed:
+            started = time.monotonic()
+            self.poll()
+            self.update()
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Live plot of a session published with --publish")
+    arg_parser.add_argument("--name", default=DEFAULT_NAME, help=f"Name of the stream. Default is {DEFAULT_NAME}")
+    arg_parser.add_argument("--window", type=float, default=10, help="Seconds shown. Default is 10")
+    arg_parser.add_argument("--fps", type=float, default=30, help="Maximum updates per second. Default is 30")
+    arg_parser.add_argument("--connect-timeout", type=float, default=30,
+                            help="Seconds to wait for the session to start publishing. Default is 30")
+    args = arg_parser.parse_args()
+
+    deadline = time.monotonic() + args.connect_timeout
+    while True:
+        try:
+            reader = StreamReader(args.name)
+            break
+        except FileNotFoundError:
+            if time.monotonic() > deadline:
+                print(f"No stream named {args.name}")
+                return
+            time.sleep(0.2)
+
+    Dashboard(reader, window=args.window).run(fps=args.fps)
+    reader.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+import argparse
+import time
+from abc import ABC, abstractmethod
+
+import numpy as np
+from scipy.signal import lfilter, remez
+
+
+class EnvelopeDetector(ABC):
+    """
+    Turns blocks of the bandpassed signal into its envelope. Detectors keep their state between blocks, so splitting
+    the signal into blocks does not change the output, and work on any number of channels along the leading axes.
+    """
+    name = None
+
+    def __init__(self, sampling_frequency: int, shape: tuple = ()):
+        """
+        :param sampling_frequency: Sampling frequency of the signal in Hz
+        :param shape: Shape of the leading axes, e.g. `(channels,)`
+        """
+        self.fs = sampling_frequency
+        self.shape = tuple(shape)
+
+    @property
+    @abstractmethod
+    def latency(self):
+        """
+        :return: Delay in seconds the detector adds to a change of the signal (group delay)
+        """
+
+    @abstractmethod
+    def apply_block(self, bandpassed):
+        """
+        :param bandpassed: Block of the bandpassed signal (time on the last axis)
+        :return: Envelope of the block
+        """
+
+
+class _Fir:
+    """
+    FIR filter along the last axis that carries its state over from block to block.
+    """
+
+    def __init__(self, taps, shape):
+        self.taps = np.asarray(taps, dtype=float)
+        self.zi = np.zeros(tuple(shape) + (len(self.taps) - 1,))
+
+    def __call__(self, x):
+        y, self.zi = lfilter(self.taps, [1.0], x, axis=-1, zi=self.zi)
+        return y
+
+
+class MovingMean(EnvelopeDetector):
+    """
+    Mean of the rectified signal over a sliding window, like the default mean filter of `Filter` but without counting
+    the newest sample twice.
+    """
+    name = "mean"
+
+    def __init__(self, sampling_frequency: int, shape: tuple = (), window: float = 1 / 3):
+        """
+        :param window: Length of the window in seconds
+        """
+        super().__init__(sampling_frequency, shape)
+        self.size = max(int(window * sampling_frequency), 1)
+        self._mean = _Fir(np.full(self.size, 1 / self.size), self.shape)
+
+    @property
+    def latency(self):
+        return (self.size - 1) / 2 / self.fs
+
+    def apply_block(self, bandpassed):
+        return self._mean(np.abs(bandpassed))
+
+
+class MovingRms(EnvelopeDetector):
+    """
+    Root mean square over a short sliding window.
+    """
+    name = "rms"
+
+    def __init__(self, sampling_frequency: int, shape: tuple = (), window: float = 0.1):
+        """
+        :param window: Length of the window in seconds
+        """
+        super().__init__(sampling_frequency, shape)
+        self.size = max(int(window * sampling_frequency), 1)
+        self._mean = _Fir(np.full(self.size, 1 / self.size), self.shape)
+
+    @property
+    def latency(self):
+        return (self.size - 1) / 2 / self.fs
+
+    def apply_block(self, bandpassed):
+        return np.sqrt(np.maximum(self._mean(np.square(bandpassed)), 0))
+
+
+class TeagerKaiser(EnvelopeDetector):
+    """
+    Teager-Kaiser energy `x[n-1]² - x[n] x[n-2]`, smoothed over a short window. It rises with both the amplitude and
+    the frequency of the signal, which makes muscle bursts stand out. Returned as a square root to stay in the units
+    of the signal.
+    """
+    name = "tkeo"
+
+    def __init__(self, sampling_frequency: int, shape: tuple = (), window: float = 0.05):
+        """
+        :param window: Length of the smoothing window in seconds
+        """
+        super().__init__(sampling_frequency, shape)
+        self.size = max(int(window * sampling_frequency), 1)
+        self._mean = _Fir(np.full(self.size, 1 / self.size), self.shape)
+        self._previous = np.zeros(self.shape + (2,))
+
+    @property
+    def latency(self):
+        # The operator is centred on the previous sample
+        return (1 + (self.size - 1) / 2) / self.fs
+
+    def apply_block(self, bandpassed):
+        x = np.concatenate((self._previous, bandpassed), axis=-1)
+        self._previous = x[..., -2:]
+        energy = x[..., 1:-1] ** 2 - x[..., 2:] * x[..., :-2]
+        return np.sqrt(np.maximum(self._mean(np.abs(energy)), 0))
+
+
+class ExponentialEnvelope(EnvelopeDetector):
+    """
+    Rectified signal smoothed by a first-order low-pass filter, i.e. an exponentially weighted moving average.
+    """
+    name = "exponential"
+
+    def __init__(self, sampling_frequency: int, shape: tuple = (), time_constant: float = 0.03):
+        """
+        :param time_constant: Time constant of the smoothing in seconds
+        """
+        super().__init__(sampling_frequency, shape)
+        self.alpha = 1 - np.exp(-1 / (time_constant * sampling_frequency))
+        self.b, self.a = [self.alpha], [1.0, self.alpha - 1]
+        self.zi = np.zeros(self.shape + (1,))
+
+    @property
+    def latency(self):
+        return (1 - self.alpha) / self.alpha / self.fs
+
+    def apply_block(self, bandpassed):
+        envelope, self.zi = lfilter(self.b, self.a, np.abs(bandpassed), axis=-1, zi=self.zi)
+        return envelope
+
+
+class HilbertEnvelope(EnvelopeDetector):
+    """
+    Magnitude of the analytic signal, with the Hilbert transform approximated by a causal FIR filter and the signal
+    delayed by the same number of samples to line up with it.
+    """
+    name = "hilbert"
+
+    def __init__(self, sampling_frequency: int, shape: tuple = (), taps: int = 31, low: float = 5,
+                 smoothing: float = 0.02):
+        """
+        :param taps: Length of the FIR Hilbert transformer, odd
+        :param low: Lowest frequency in Hz the transformer has to be accurate for
+        :param smoothing: Time constant in seconds of the exponential smoothing of the magnitude, 0 to turn it off
+        """
+        super().__init__(sampling_frequency, shape)
+        self.taps = taps + (taps + 1) % 2
+        nyquist = sampling_frequency / 2
+        hilbert = remez(self.taps, [low, nyquist - low], [1], type="hilbert", fs=sampling_frequency)
+        delay = np.zeros(self.taps)
+        delay[(self.taps - 1) // 2] = 1
+        self._hilbert = _Fir(hilbert, self.shape)
+        self._delay = _Fir(delay, self.shape)
+        self._smoothing = ExponentialEnvelope(sampling_frequency, shape, smoothing) if smoothing else None
+
+    @property
+    def latency(self):
+        delay = (self.taps - 1) / 2 / self.fs
+        return delay + (self._smoothing.latency if self._smoothing is not None else 0)
+
+    def apply_block(self, bandpassed):
+        magnitude = np.hypot(self._delay(bandpassed), self._hilbert(bandpassed))
+        return self._smoothing.apply_block(magnitude) if self._smoothing is not None else magnitude
+
+
+DETECTORS = {detector.name: detector for detector in
+             [MovingMean, MovingRms, TeagerKaiser, ExponentialEnvelope, HilbertEnvelope]}
+
+
+def create_detector(name: str, sampling_frequency: int, shape: tuple = ()):
+    """
+    :param name: One of `DETECTORS`
+    :return: Envelope detector with its default parameters
+    """
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown envelope detector: {name}")
+    return DETECTORS[name](sampling_frequency, shape)
+
+
+def measure_cost(name: str, sampling_frequency: int = 250, block_size: int = 4, seconds: float = 60):
+    """
+    :return: Seconds of computation per sample when the detector is fed blocks of `block_size` samples
+    """
+    detector = create_detector(name, sampling_frequency)
+    signal = np.random.default_rng(0).standard_normal(int(seconds * sampling_frequency))
+    started = time.perf_counter()
+    for start in range(0, len(signal), block_size):
+        detector.apply_block(signal[start:start + block_size])
+    return (time.perf_counter() - started) / len(signal)
+
+
+def separation(envelope, labels):
+    """
+    :param envelope: Envelope of a recording
+    :param labels: Phase of every sample, e.g. "Relax" or "MotorTask"
+    :return: Distance between the MotorTask and the Relax envelope in pooled standard deviations (d'), and the
+    fraction of the MotorTask and the Relax samples above the Relax mean + 3 standard deviations
+    """
+    relax = envelope[labels == "Relax"]
+    motor_task = envelope[labels == "MotorTask"]
+    if len(relax) < 2 or len(motor_task) < 2:
+        return None, None, None
+    pooled = np.sqrt((relax.var() + motor_task.var()) / 2)
+    threshold = relax.mean() + 3 * relax.std()
+    return ((motor_task.mean() - relax.mean()) / pooled if pooled else None, float(np.mean(motor_task > threshold)),
+            float(np.mean(relax > threshold)))
+
+
+def phase_labels(n: int, boundaries, phases):
+    """
+    :param n: Number of samples
+    :param boundaries: First sample of every phase
+    :param phases: Name of every phase
+    :return: Phase of every sample, "" before the first phase
+    """
+    labels = np.full(n, "", dtype=object)
+    ends = list(boundaries[1:]) + [n]
+    for first, end, phase in zip(boundaries, ends, phases):
+        labels[first:end] = phase
+    return labels
+
+
+def compare(path: str, channel: int = 1, sampling_rate: int = 250, bandpass_low: int = 30, bandpass_high: int = 45,
+            interaction: str = None, start: float = 0, skip: float = 1, block_size: int = 4):
+    """
+    Runs a recording through `Filter` with every detector and reports how well each separates Relax from MotorTask.
+    :param interaction: Interaction log of the recording to take the phases from. Without it, the phases are
+    simulated with the level of the game starting at `start`
+    :param skip: Seconds at the start left out while the filters settle
+    :param block_size: Number of samples filtered at once, as polled in a session
+    :return: List of dictionaries with the name, the latency, the cost and the separation of each detector, the default
+    mean filter of `Filter` first
+    """
+    from epochs import read_events, read_recording, to_samples
+    from filter import Filter
+    from replay import replay_file
+
+    data, timestamps = read_recording(path, [channel])
+    signal = data[0]
+    if interaction is not None:
+        events = read_events(interaction)
+        phase = events.types == "Phase"
+        boundaries, phases = to_samples(timestamps, events.times[phase]), events.values[phase]
+    else:
+        result = replay_file(path, sampling_rate=sampling_rate, channel=channel, bandpass_low=bandpass_low,
+                             bandpass_high=bandpass_high, start=start)
+        boundaries = [int(t * sampling_rate) for t, _ in result.phases]
+        phases = [phase for _, phase in result.phases]
+    labels = phase_labels(len(signal), boundaries, phases)
+    labels[:int(skip * sampling_rate)] = ""
+
+    rows = []
+    for name in [None] + list(DETECTORS):
+        emg_filter = Filter(sampling_frequency=sampling_rate, bandpass_low=bandpass_low, bandpass_high=bandpass_high,
+                            retention=len(signal) / sampling_rate + 1, envelope=name)
+        started = time.perf_counter()
+        for i in range(0, len(signal), block_size):
+            emg_filter.apply_block(signal[i:i + block_size])
+        cost = (time.perf_counter() - started) / len(signal)
+        d_prime, motor_task_above, relax_above = separation(emg_filter.output.last(len(signal)), labels)
+        rows.append({"detector": name or "default", "latency_ms": round(emg_filter.envelope_latency * 1000, 1),
+                     "filter_us": round(cost * 1e6, 2),
+                     "detector_us": round(measure_cost(name, sampling_rate, block_size) * 1e6, 2) if name else None,
+                     "d_prime": None if d_prime is None else round(float(d_prime), 2),
+                     "motor_task_above": None if motor_task_above is None else round(motor_task_above, 3),
+                     "relax_above": None if relax_above is None else round(relax_above, 3)})
+        emg_filter.close()
+    return rows
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Compare the envelope detectors on a recording")
+    arg_parser.add_argument("file", help="Recording to compare the detectors on, .csv or .bcirec")
+    arg_parser.add_argument("--interaction", default=None,
+                            help="Interaction log of the recording. Default is to simulate the phases of the game")
+    arg_parser.add_argument("--channel", type=int, default=1, help="no. of the EMG channel. Default is 1")
+    arg_parser.add_argument("--sampling-rate", type=int, default=250, help="Sampling rate in Hz. Default is 250")
+    arg_parser.add_argument("--start", type=float, default=0,
+                            help="Second of the recording at which the game starts, without --interaction. "
+                                 "Default is 0")
+    args = arg_parser.parse_args()
+
+    rows = compare(args.file, channel=args.channel, sampling_rate=args.sampling_rate, interaction=args.interaction,
+                   start=args.start)
+    columns = [("detector", 12), ("latency_ms", 11), ("filter_us", 10), ("detector_us", 12), ("d_prime", 8),
+               ("motor_task_above", 17), ("relax_above", 12)]
+    print(" ".join(f"{column:>{width}}" for column, width in columns))
+    for row in rows:
+        print(" ".join(f"{str(row[column]):>{width}}" for column, width in columns))
+    print("latency_ms: delay the envelope adds, filter_us/detector_us: time per sample of the whole filter/the "
+          "detector alone, d_prime: MotorTask vs. Relax separation, *_above: fraction above the Relax mean + 3 SD")
+
+
+if __name__ == "__main__":
+    main()
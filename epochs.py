@@ -0,0 +1,131 @@
+import argparse
+from collections import namedtuple
+
+import numpy as np
+
+from recording import EXTENSION, RecordingReader, read_chunks
+
+# Events of an interaction log as arrays: UTC times in seconds since the epoch, types and values
+Events = namedtuple("Events", ["times", "types", "values"])
+# Epochs of a session: data (channels x samples x trials), label and first sample of every trial
+Epochs = namedtuple("Epochs", ["data", "labels", "onsets", "sampling_rate", "channels"])
+
+
+def read_events(path: str):
+    """
+    Parses a whole interaction log at once.
+    :return: `Events`
+    """
+    with open(path) as f:
+        lines = f.read().splitlines()[1:]  # header
+    fields = [line.split(";", 3) for line in lines if line.count(";") >= 2]
+    if not fields:
+        return Events(np.zeros(0), np.zeros(0, dtype=str), np.zeros(0, dtype=str))
+    columns = list(zip(*fields))
+    # The logged datetimes are UTC without a time zone, like the BrainFlow timestamps
+    times = np.array(columns[0], dtype="datetime64[us]").astype(np.int64) / 1e6
+    return Events(times, np.array(columns[1]), np.array(columns[2]))
+
+
+def read_recording(path: str, rows, timestamp_row: int = 22):
+    """
+    :param path: Tab-separated file recorded with BrainFlow or binary recording
+    :param rows: Rows of the board data to read
+    :return: Data of the rows (rows x samples) and the BrainFlow timestamps of the samples
+    """
+    rows = list(rows)
+    if path.endswith(EXTENSION):
+        reader = RecordingReader(path)
+        return reader.board_data()[rows], reader.timestamps
+    chunks = list(read_chunks(path))
+    data = np.concatenate([chunk[rows] for chunk in chunks], axis=1)
+    timestamps = np.concatenate([chunk[timestamp_row] for chunk in chunks])
+    return data, timestamps
+
+
+def event_labels(events: Events):
+    """
+    :return: Label of every event: the phase for `Phase` events, the type for the others
+    """
+    return np.where(events.types == "Phase", events.values, events.types)
+
+
+def to_samples(timestamps, times):
+    """
+    Maps times to the first sample recorded at or after them.
+    :param timestamps: BrainFlow timestamps of the samples
+    :param times: Times in seconds since the epoch
+    :return: Sample indices, `len(timestamps)` for times after the recording
+    """
+    # BrainFlow timestamps may jitter backwards by a little, the lookup needs them sorted
+    return np.searchsorted(np.maximum.accumulate(timestamps), times, side="left")
+
+
+def extract_epochs(data, timestamps, events: Events, sampling_rate: int, labels=("Relax", "MotorTask"),
+                   length: float = 4.0, offset: float = 0.5, channels=None):
+    """
+    Cuts an epoch of the same length out of the data after every event with one of the labels.
+    :param data: Data of the channels (channels x samples)
+    :param timestamps: BrainFlow timestamps of the samples
+    :param events: Events of the interaction log
+    :param sampling_rate: Sampling rate in Hz
+    :param labels: Labels of the events to cut epochs at, see `event_labels`
+    :param length: Length of an epoch in seconds
+    :param offset: Seconds between the event and the start of its epoch
+    :param channels: Numbers of the channels, stored with the epochs
+    :return: `Epochs`, phases that end before their epoch does are left out
+    """
+    n = int(round(length * sampling_rate))
+    all_labels = event_labels(events)
+
+    # A phase lasts until the next phase starts
+    phase_events = np.flatnonzero(events.types == "Phase")
+    ends = np.full(len(events.times), np.inf)
+    ends[phase_events[:-1]] = events.times[phase_events[1:]]
+
+    selected = np.flatnonzero(np.isin(all_labels, labels) & (events.times + offset + length <= ends))
+    onsets = to_samples(timestamps, events.times[selected] + offset)
+    valid = onsets + n <= data.shape[-1]
+    selected, onsets = selected[valid], onsets[valid]
+
+    # Samples x trials indices, the epochs are copied once straight into their final layout
+    epochs = np.take(data, np.arange(n)[:, None] + onsets, axis=-1)
+    return Epochs(epochs, all_labels[selected], onsets, sampling_rate,
+                  np.array(channels if channels is not None else range(data.shape[0])))
+
+
+def epochs_from_files(emg_path: str, interaction_path: str, channels=(1,), sampling_rate: int = 250, **kwargs):
+    """
+    Reads a session and cuts it into epochs, see `extract_epochs` for the keyword arguments.
+    :return: `Epochs`
+    """
+    if emg_path.endswith(EXTENSION):
+        sampling_rate = RecordingReader(emg_path).sampling_rate
+    data, timestamps = read_recording(emg_path, channels)
+    return extract_epochs(data, timestamps, read_events(interaction_path), sampling_rate, channels=channels,
+                          **kwargs)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Cut a recorded session into labelled epochs")
+    arg_parser.add_argument("emg", help="EMG recording of the session, .csv or .bcirec")
+    arg_parser.add_argument("interaction", help="Interaction log of the session")
+    arg_parser.add_argument("--channels", type=int, nargs="+", default=[1], help="no. of the channels. Default is 1")
+    arg_parser.add_argument("--sampling-rate", type=int, default=250, help="Sampling rate in Hz. Default is 250")
+    arg_parser.add_argument("--labels", nargs="+", default=["Relax", "MotorTask"],
+                            help="Phases or event types to cut epochs at. Default is Relax and MotorTask")
+    arg_parser.add_argument("--length", type=float, default=4.0, help="Length of an epoch in seconds. Default is 4")
+    arg_parser.add_argument("--offset", type=float, default=0.5,
+                            help="Seconds between the event and the start of the epoch. Default is 0.5")
+    arg_parser.add_argument("--output", default="epochs.npz", help="File to save the epochs to. Default is epochs.npz")
+    args = arg_parser.parse_args()
+
+    epochs = epochs_from_files(args.emg, args.interaction, channels=args.channels, sampling_rate=args.sampling_rate,
+                               labels=args.labels, length=args.length, offset=args.offset)
+    np.savez(args.output, **epochs._asdict())
+    counts = ", ".join(f"{label}: {np.count_nonzero(epochs.labels == label)}" for label in args.labels)
+    print(f"{epochs.data.shape[-1]} epochs of {epochs.data.shape[1]} samples ({counts}) saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,56 @@
 import numpy as np
-from scipy.signal import lfilter_zi, lfilter, iirfilter
+from scipy.signal import lfilter_zi, lfilter, iirfilter, sosfilt, sosfilt_zi
+
+from baseline import BaselineEstimator
+from envelope import create_detector
+from ring_buffer import RingBuffer
+
+
+def _moving_mean(history, block, kernel_size, samples_before):
+    """
+    Moving mean of `block` over the last `kernel_size` samples, counting the newest sample twice like `Filter.apply`.
+    :param history: Up to `kernel_size - 1` samples preceding the block (time on the last axis)
+    :param block: New samples (time on the last axis)
+    :param kernel_size: Size of the kernel for the mean filter
+    :param samples_before: Number of samples that have been filtered before this block
+    :return: Mean-filtered block
+    """
+    n = block.shape[-1]
+    h = history.shape[-1]
+    joined = np.concatenate((np.zeros(block.shape[:-1] + (1,)), history, block), axis=-1)
+    cumsum = np.cumsum(joined, axis=-1)
+    
+    # Absolute index of every new sample and the start of its window
+    index = samples_before + np.arange(n)
+    start = np.maximum(index - kernel_size + 1, 0)
+    # Positions in `cumsum`, which starts `h` samples before the block (plus one for the leading zero)
+    offset = samples_before - h
+    window_sum = cumsum[..., index - offset + 1] - cumsum[..., start - offset]
+    count = np.minimum(index + 1, kernel_size) + 1
+    return (window_sum + block) / count
 
 
 class Filter:
+    # Shape of a single input sample, time is always on the last axis
+    shape = ()
+    
     def __init__(self, sampling_frequency: int = 4000, bandpass_low: int = 20, bandpass_high: int = 200,
-                 bandpass_order: int = 4, mean_kernel_size: int = None):
+                 bandpass_order: int = 4, mean_kernel_size: int = None, retention: float = 600,
+                 spill_prefix: str = None, baseline_window: float = 3, baseline_guard: float = 0.5,
+                 baseline_half_life: float = None, envelope: str = None):
         """
         :param sampling_frequency: Sampling frequency of the signal in Hz
         :param bandpass_low: Low cut for the bandpass filter in Hz
         :param bandpass_high: High cut for the bandpass filter in Hz
         :param bandpass_order: Order of the bandpass filter
         :param mean_kernel_size: Size of the kernel for the mean filter. Default is a third of a second.
+        :param retention: Number of seconds of the signal to keep in memory
+        :param spill_prefix: If set, the full history is written to `<spill_prefix>-input.f64` etc.
+        :param baseline_window: Number of seconds of the latest baseline the baseline is estimated from
+        :param baseline_guard: Number of seconds at the end of the baseline that are left out
+        :param baseline_half_life: If set, the baseline is estimated from all the baselines of the session instead,
+        with the weight of a sample halving every `baseline_half_life` seconds of baseline
+        :param envelope: Name of the envelope detector to use instead of the mean filter, see `envelope.DETECTORS`
         """
         # Define the parameters of the bandpass filter
         self.fs = sampling_frequency
@@ -18,10 +58,13 @@ class Filter:
         self.bandpass_high = bandpass_high
         self.bandpass_order = bandpass_order
         self.mean_kernel_size = mean_kernel_size if mean_kernel_size else int(self.fs / 3)
+        self.envelope = create_detector(envelope, self.fs, self.shape) if envelope else None
         
-        self.input = []
-        self.bandpassed = []
-        self.output = []
+        # Keep at least the mean kernel and the baseline window in memory
+        capacity = max(int(retention * self.fs), self.mean_kernel_size, self.fs * 4)
+        self.input = self._create_buffer(capacity, spill_prefix, "input", self.shape)
+        self.bandpassed = self._create_buffer(capacity, None, "bandpassed", self.shape)
+        self.output = self._create_buffer(capacity, spill_prefix, "output")
         
         self.b, self.a = self._create_bandpass()
         self.zi = lfilter_zi(self.b, self.a)
@@ -30,6 +73,26 @@ class Filter:
         self.baseline_end = None
         self.baseline = None
         self.baseline_std = None
+        
+        self.baseline_window = int(baseline_window * self.fs)
+        self.baseline_guard = int(baseline_guard * self.fs)
+        self.baseline_half_life = baseline_half_life * self.fs if baseline_half_life else None
+        self.baseline_estimator = BaselineEstimator(self.baseline_window, half_life=self.baseline_half_life)
+        # Samples up to here have been added to the baseline estimate
+        self._baseline_added = 0
+    
+    @staticmethod
+    def _create_buffer(capacity, spill_prefix, name, shape=()):
+        return RingBuffer(capacity, shape=shape, spill_path=f"{spill_prefix}-{name}.f64" if spill_prefix else None)
+    
+    @property
+    def envelope_latency(self):
+        """
+        :return: Delay in seconds the envelope adds to a change of the signal
+        """
+        if self.envelope is not None:
+            return self.envelope.latency
+        return self.mean_kernel_size / 2 / self.fs
     
     def _create_bandpass(self):
         b, a = iirfilter(self.bandpass_order, [self.bandpass_low, self.bandpass_high], fs = self.fs, btype='band', ftype='butter')
@@ -40,6 +103,9 @@ class Filter:
         :param sample: New sample to be filtered
         :return: Filtered sample
         """
+        if self.envelope is not None:
+            return self.apply_block([sample])[0]
+        
         # Add the sample to the input buffer
         self.input.append(sample)
         
@@ -49,30 +115,170 @@ class Filter:
         self.bandpassed.append(sample)
         
         # Apply mean filter
-        if len(self.bandpassed) > self.mean_kernel_size:
-            sample = np.mean(self.bandpassed[-self.mean_kernel_size:] + [sample])
-        else:
-            sample = np.mean(self.bandpassed + [sample])
+        window = self.bandpassed.last(self.mean_kernel_size)
+        sample = (np.sum(window) + sample) / (len(window) + 1)
 
         self.output.append(sample)
         
         return sample
     
-    def mark_as_baseline(self):
+    def apply_block(self, samples):
+        """
+        Filters a whole block of samples at once. Gives the same output as calling `apply` on every sample.
+        :param samples: Block of new samples to be filtered
+        :return: Filtered block as a NumPy array
+        """
+        samples = np.asarray(samples, dtype=float)
+        if len(samples) == 0:
+            return samples
+        self.input.append(samples)
+        
+        # Apply the bandpass filter, carrying the filter state over from the previous block
+        bandpassed, self.zi = lfilter(self.b, self.a, samples, zi=self.zi)
+        if self.envelope is not None:
+            output = self.envelope.apply_block(bandpassed)
+            bandpassed = np.abs(bandpassed)
+        else:
+            bandpassed = np.abs(bandpassed)
+            # Apply mean filter using a cumulative sum over the tail of the previous block and the new block
+            history = self.bandpassed.last(self.mean_kernel_size - 1)
+            output = _moving_mean(history, bandpassed, self.mean_kernel_size, len(self.bandpassed))
+        
+        self.bandpassed.append(bandpassed)
+        self.output.append(output)
+        
+        return output
+    
+    def mark_as_baseline(self, index: int = None):
+        """
+        Marks the signal as baseline and keeps updating the baseline estimate while it is.
+        :param index: Sample up to which the signal is baseline, defaults to the end of the output
+        """
+        index = len(self.output) if index is None else index
         if self.baseline_start is None:
-            self.baseline_start = len(self.output)
+            self.baseline_start = index
+        # The samples right before the end of the baseline are only added once it's clear the baseline goes on
+        self._add_to_baseline(index - self.baseline_guard)
     
-    def mark_as_NOT_baseline(self):
+    def mark_as_NOT_baseline(self, index: int = None):
+        """
+        :param index: Sample at which the baseline ends, defaults to the end of the output
+        """
         if self.baseline_start is None:
             return
         if self.baseline_end is None:
-            self.baseline_end = len(self.output)
-            actual_end = int(250 / 2)  # half a second
-            actual_start = 250 * 3 + actual_end  # 3 seconds
-            data = self.output[self.baseline_end - actual_start:self.baseline_end - actual_end]
-            self.baseline = np.mean(data)
-            self.baseline_std = np.std(data)
+            self.baseline_end = len(self.output) if index is None else index
+            self._add_to_baseline(self.baseline_end - self.baseline_guard)
+    
+    def _add_to_baseline(self, stop):
+        start = max(self.baseline_start, self._baseline_added, self.output.start)
+        if stop <= start:
+            return
+        self._baseline_added = stop
+        self._update_baseline(start, stop)
+    
+    def _update_baseline(self, start, stop):
+        self.baseline_estimator.update(self.output[start:stop])
+        if self.baseline_estimator.ready:
+            self.baseline = self.baseline_estimator.mean
+            self.baseline_std = self.baseline_estimator.std
     
     def reset_baseline(self):
         self.baseline_start = None
         self.baseline_end = None
+    
+    def close(self):
+        for buffer in (self.input, self.bandpassed, self.output):
+            buffer.close()
+
+
+class FilterBank(Filter):
+    """
+    Filters several channels of the board at once. The bandpass and the mean filter run vectorized across the channel
+    axis, `output` holds the combination of the channel envelopes that the scenes threshold on.
+    """
+    
+    def __init__(self, channels, sampling_frequency: int = 4000, bandpass_low: int = 20, bandpass_high: int = 200,
+                 bandpass_order: int = 4, mean_kernel_size: int = None, retention: float = 600,
+                 spill_prefix: str = None, baseline_window: float = 3, baseline_guard: float = 0.5,
+                 baseline_half_life: float = None, combine="mean", envelope: str = None):
+        """
+        :param channels: Rows of the board data to filter
+        :param combine: How to combine the channel envelopes into `output`: "mean", "max" or one of `channels`
+        See `Filter` for the rest of the parameters.
+        """
+        self.channels = list(channels)
+        if combine not in ("mean", "max") and combine not in self.channels:
+            raise ValueError(f"Unknown combination: {combine}")
+        self.combine = combine
+        self.shape = (len(self.channels),)
+        
+        super().__init__(sampling_frequency=sampling_frequency, bandpass_low=bandpass_low,
+                         bandpass_high=bandpass_high, bandpass_order=bandpass_order,
+                         mean_kernel_size=mean_kernel_size, retention=retention, spill_prefix=spill_prefix,
+                         baseline_window=baseline_window, baseline_guard=baseline_guard,
+                         baseline_half_life=baseline_half_life, envelope=envelope)
+        
+        self.channel_output = self._create_buffer(self.input.capacity, spill_prefix, "channel-output", self.shape)
+        
+        self.sos = iirfilter(self.bandpass_order, [self.bandpass_low, self.bandpass_high], fs=self.fs, btype='band',
+                             ftype='butter', output='sos')
+        # Same initial state as `Filter`, repeated for every channel
+        self.zi = np.repeat(sosfilt_zi(self.sos)[:, np.newaxis, :], len(self.channels), axis=1)
+        
+        self.channel_baseline = None
+        self.channel_baseline_std = None
+        self.channel_baseline_estimator = BaselineEstimator(self.baseline_window, shape=self.shape,
+                                                            half_life=self.baseline_half_life)
+    
+    def apply(self, sample):
+        """
+        :param sample: New column of the board data to be filtered
+        :return: Filtered and combined sample
+        """
+        return self.apply_block(np.asarray(sample, dtype=float)[:, np.newaxis])[0]
+    
+    def apply_block(self, samples):
+        """
+        :param samples: Block of the board data as returned by `get_board_data()` (channels x samples)
+        :return: Filtered block combined across the channels
+        """
+        samples = np.asarray(samples, dtype=float)[self.channels]
+        if samples.shape[-1] == 0:
+            return np.zeros(0)
+        self.input.append(samples)
+        
+        bandpassed, self.zi = sosfilt(self.sos, samples, axis=-1, zi=self.zi)
+        if self.envelope is not None:
+            envelopes = self.envelope.apply_block(bandpassed)
+            bandpassed = np.abs(bandpassed)
+        else:
+            bandpassed = np.abs(bandpassed)
+            history = self.bandpassed.last(self.mean_kernel_size - 1)
+            envelopes = _moving_mean(history, bandpassed, self.mean_kernel_size, len(self.bandpassed))
+        
+        self.bandpassed.append(bandpassed)
+        self.channel_output.append(envelopes)
+        
+        output = self._combine(envelopes)
+        self.output.append(output)
+        
+        return output
+    
+    def _combine(self, envelopes):
+        if self.combine == "mean":
+            return envelopes.mean(axis=0)
+        if self.combine == "max":
+            return envelopes.max(axis=0)
+        return envelopes[self.channels.index(self.combine)]
+    
+    def _update_baseline(self, start, stop):
+        super()._update_baseline(start, stop)
+        self.channel_baseline_estimator.update(self.channel_output[start:stop])
+        if self.channel_baseline_estimator.ready:
+            self.channel_baseline = self.channel_baseline_estimator.mean
+            self.channel_baseline_std = self.channel_baseline_estimator.std
+    
+    def close(self):
+        super().close()
+        self.channel_output.close()
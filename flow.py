@@ -1,15 +1,36 @@
 from datetime import datetime
 
+import numpy as np
 from brainflow.board_shim import BoardShim, BrainFlowInputParams, BoardIds
 
+from recording import Recorder, EXTENSION
+
+STREAM_BUFFER_SIZE = 250 * 2  # no. of samples BrainFlow keeps before it starts dropping the oldest ones
+
 
 class Flow:
-    def __init__(self, mode, channel=0, input_="cyton", file_="examples/example_1.csv"):
+    def __init__(self, mode, channel=0, input_="cyton", file_="examples/example_1.csv", record="csv",
+                 poll_limit=None):
+        """
+        :param record: Format to record the session in, "csv" (BrainFlow) or "binary"
+        :param poll_limit: If set, every poll takes at most this many samples from the board and leaves the rest for
+        the following polls. Otherwise, every poll drains the board.
+        """
         self.input = input_
         self.board = None
         self.now = None
         self.mode = mode
         self.channel = channel
+        self.record = record
+        self.recorder = None
+
+        self.poll_limit = poll_limit
+        self.rows = None
+        self.timestamp_row = None
+        self._last_data = None
+        self.backlog = 0  # no. of samples left on the board after the last poll
+        # no. of polls that found the board buffer full, i.e. samples may have been dropped, also from a binary recording
+        self.overruns = 0
 
         BoardShim.enable_dev_board_logger()
 
@@ -44,19 +65,69 @@ class Flow:
         self.board.prepare_session()
         # Get formatted UTC time
         self.now = datetime.utcnow()
-        self.board.start_stream(250 * 2, f"file://./logs/{self.now.strftime('%Y-%m-%d-%H-%M-%S')}_{self.mode}.csv:w")
+        name = f"logs/{self.now.strftime('%Y-%m-%d-%H-%M-%S')}_{self.mode}"
+        data_board_id = self._data_board_id()
+        rows = BoardShim.get_num_rows(data_board_id)
+        self.rows = rows
+        self.timestamp_row = BoardShim.get_timestamp_channel(data_board_id)
+        if self.record == "binary":
+            self.recorder = Recorder(name + EXTENSION, channels=rows, timestamp_row=self.timestamp_row,
+                                     sampling_rate=self.get_sample_rate(),
+                                     metadata={"board_id": int(data_board_id), "start": str(self.now)})
+            self.board.start_stream(STREAM_BUFFER_SIZE)
+        else:
+            self.board.start_stream(STREAM_BUFFER_SIZE, f"file://./{name}.csv:w")
 
-    def get_sample_rate(self):
+    def _data_board_id(self):
+        # Boards streaming on behalf of another board return the data of the master board
         if self._cyton():
-            return self.board.get_sampling_rate(self.board_id)
-        return self.board.get_sampling_rate(self.params.master_board)
+            return self.board_id
+        return self.params.master_board
+
+    def get_sample_rate(self):
+        return self.board.get_sampling_rate(self._data_board_id())
 
     def stop(self):
         self.board.stop_stream()
+        if self.recorder is not None:
+            # Keep the samples that arrived after the last poll, like the CSV streamer does
+            self.recorder.write(self.board.get_board_data())
+            self.recorder.close()
         self.board.release_session()
 
     def _get_data(self):
-        return self.board.get_board_data()
+        if self.poll_limit is not None:
+            return self._poll()
+        data = self.board.get_board_data()
+        if data.shape[-1] >= STREAM_BUFFER_SIZE:
+            self.overruns += 1
+        if self.recorder is not None:
+            self.recorder.write(data)
+        self._last_data = data
+        return data
+
+    def _poll(self):
+        """
+        Takes at most `poll_limit` samples from the board.
+        :return: The new samples (rows x samples)
+        """
+        count = self.board.get_board_data_count()
+        if count >= STREAM_BUFFER_SIZE:
+            self.overruns += 1
+        n = min(count, self.poll_limit)
+        self.backlog = count - n
+        # BrainFlow returns a new array for every poll, it is used as is rather than copied into a buffer
+        data = self.board.get_board_data(n) if n > 0 else np.zeros((self.rows, 0))
+        if self.recorder is not None and n > 0:
+            self.recorder.write(data)
+        self._last_data = data
+        return data
+
+    def get_timestamps(self):
+        """
+        :return: BrainFlow timestamps of the samples from the last poll
+        """
+        return self._last_data[self.timestamp_row] if self._last_data is not None else None
 
     def get_user_input(self, data=None):
         if data is None:
@@ -68,3 +139,15 @@ class Flow:
             return emg
         else:
             return None
+
+    def get_board_input(self, data=None):
+        """
+        :return: All the rows of the new board data (channels x samples), or None if there is no new data
+        """
+        if data is None:
+            data = self._get_data()
+
+        if data.shape[-1] > 0:
+            return data
+        else:
+            return None
@@ -1,40 +1,63 @@
+import math
 import random
+import time
 
 import pygame
 
 import constants
+from assets import assets
+from game_state import HIT_PENALTY, STEP, GameState
 from scene import Scene
 
-GAME_SPEED = 4  # 2 tiles per second at 60 fps
-GRAVITY = 0.062
-HIT_PENALTY = 3000  # 3s of penalty
-
-
-def _tint_surf(original, colour):
-    surf = original.copy()
-    surf.fill((0, 0, 0, 255), None, pygame.BLEND_RGBA_MULT)
-    surf.fill(colour + (0,), None, pygame.BLEND_RGBA_ADD)
-    return surf
+MAX_CATCH_UP = 1.0  # longest stall in seconds the simulation catches up on, longer ones are skipped
+CHUNK_TILES = 16  # no. of tiles pre-rendered together into one surface of the level strip
+
+BACKGROUND_IMAGE = "assets/Backgrounds/backgroundEmpty.png"
+FLAG_IMAGES = ["assets/PNG/Items/flagYellow1.png", "assets/PNG/Items/flagYellow2.png"]
+PLAYER_WALK_IMAGES = ["assets/PNG/Players/128x256/Yellow/alienYellow_walk1.png",
+                      "assets/PNG/Players/128x256/Yellow/alienYellow_walk2.png"]
+PLAYER_JUMP_IMAGE = "assets/PNG/Players/128x256/Yellow/alienYellow_jump.png"
+PLAYER_STAND_IMAGE = "assets/PNG/Players/128x256/Yellow/alienYellow_stand.png"
+GROUND_LEFT_IMAGE = "assets/PNG/Ground/Grass/grassLeft.png"
+SAND_RIGHT_IMAGE = "assets/PNG/Ground/Sand/sandRight.png"
+GROUND_IMAGE = "assets/PNG/Ground/Grass/grassMid.png"
+SAND_IMAGE = "assets/PNG/Ground/Sand/sandMid.png"
+CACTUS_IMAGE = "assets/PNG/Tiles/cactus.png"
+SPIKES_IMAGE = "assets/PNG/Tiles/spikes.png"
+STAR_IMAGE = "assets/PNG/Items/star.png"
+
+
+def preload_assets():
+    """
+    Starts loading the images of the game in the background. Requires the display mode to be set.
+    """
+    images = FLAG_IMAGES + PLAYER_WALK_IMAGES + [PLAYER_JUMP_IMAGE, PLAYER_STAND_IMAGE, GROUND_LEFT_IMAGE,
+                                                 SAND_RIGHT_IMAGE, GROUND_IMAGE, SAND_IMAGE, CACTUS_IMAGE,
+                                                 SPIKES_IMAGE, STAR_IMAGE]
+    keys = [(path, None, None) for path in images]
+    keys.append((BACKGROUND_IMAGE, pygame.display.get_window_size(), None))
+    keys.append((PLAYER_STAND_IMAGE, None, constants.RED))
+    assets.preload(keys)
 
 
 class Flag:
     def __init__(self, game):
         self.game = game
-        self.flag_1 = pygame.image.load("assets/PNG/Items/flagYellow1.png")
-        self.flag_2 = pygame.image.load("assets/PNG/Items/flagYellow2.png")
+        self.flag_1 = assets.get(FLAG_IMAGES[0])
+        self.flag_2 = assets.get(FLAG_IMAGES[1])
 
         self.current_image = self.flag_1
         self.last_flag_tick = pygame.time.get_ticks()
 
-    def draw(self, screen):
+    def draw(self, screen, left_corner):
         self._update()
 
-        a = self.game.left_corner
+        a = left_corner
         flag_tile = self.game.level_width
         x = a + flag_tile * self.game.tile_width
         y = self.game.y - self.flag_1.get_height()
 
-        screen.blit(self.current_image, (x, y))
+        return screen.blit(self.current_image, (x, y))
 
     def _update(self):
         ticks = pygame.time.get_ticks()
@@ -44,63 +67,28 @@ class Flag:
 
 
 class Player:
-    def __init__(self, game, ground):
+    """
+    Draws the player of the `GameState`.
+    """
+
+    def __init__(self, game: GameState):
         self.game = game
-        self.player_walk_1 = pygame.image.load("assets/PNG/Players/128x256/Yellow/alienYellow_walk1.png")
-        self.player_walk_2 = pygame.image.load("assets/PNG/Players/128x256/Yellow/alienYellow_walk2.png")
-        self.player_jump = pygame.image.load("assets/PNG/Players/128x256/Yellow/alienYellow_jump.png")
-        self.player_stand = pygame.image.load("assets/PNG/Players/128x256/Yellow/alienYellow_stand.png")
-        self.player_hit = _tint_surf(self.player_stand, constants.RED)
+        self.player_walk_1 = assets.get(PLAYER_WALK_IMAGES[0])
+        self.player_walk_2 = assets.get(PLAYER_WALK_IMAGES[1])
+        self.player_jump = assets.get(PLAYER_JUMP_IMAGE)
+        self.player_stand = assets.get(PLAYER_STAND_IMAGE)
+        self.player_hit = assets.get(PLAYER_STAND_IMAGE, tint=constants.RED)
 
         self.current_image = self.player_stand
         self.last_walk_tick = pygame.time.get_ticks()
 
-        self.player_ground = ground - self.player_walk_1.get_height()
-        self.y = self.player_ground
-        self.x = self.get_start_position()
-
-        self.vel_y = 0
-        self.last_hit = None
-        self.started = False
-
-    def get_start_position(self):
-        return pygame.display.get_window_size()[0] / 3 - self.current_image.get_width() / 2
-
-    def draw(self, screen, started):
-        self.started = started
-        self._update()
-
+    def draw(self, screen, alpha: float = 1.0):
+        """
+        :param alpha: Fraction of a step between the previous and the current simulation step to draw the player at
+        """
         self._set_player_surface()
-        screen.blit(self.current_image, (self.x, self.y))
-
-    def jump(self):
-        # Only allow jumping if the game is running
-        if self.game.reached_goal():
-            return
-        # No double jump allowed
-        if self.is_jumping():
-            return
-        # Only allow jumping in the motor task (perform) phase
-        if self.game.current_game_tile() in self.game.get_non_jumpy_tiles():
-            return
-        # Only allow jumping if we are not under penalty
-        if self.last_hit is None or self.game.time_since_hit_gt(HIT_PENALTY):
-            self.game.log("PlayerJump", None)
-            self.vel_y = -10
-
-    def hit(self):
-        self.game.log("PlayerHit", None)
-        self.last_hit = pygame.time.get_ticks()
-        # Reset the velocity if we have hit corner
-        self.vel_y = 0
-
-    def _update(self):
-        self.y += self.vel_y
-        self.vel_y += GRAVITY
-
-        if self.y > self.player_ground:
-            self.y = self.player_ground
-            self.vel_y = 0
+        y = self.game.previous_player_y + (self.game.player_y - self.game.previous_player_y) * alpha
+        return screen.blit(self.current_image, (self.game.player_x, y))
 
     def _draw_walk(self):
         ticks = pygame.time.get_ticks()
@@ -111,18 +99,14 @@ class Player:
     def _draw_jump(self):
         self.current_image = self.player_jump
 
-    def is_jumping(self):
-        return self.y < self.player_ground
-
     def _set_player_surface(self):
-        ticks = pygame.time.get_ticks()
-        if self.started:
-            if self.last_hit is not None:
-                time_since_hit = ticks - self.last_hit
+        if self.game.started:
+            if self.game.last_hit is not None:
+                time_since_hit = self.game.ticks - self.game.last_hit
                 if time_since_hit < HIT_PENALTY:
                     self.current_image = self.player_hit
                     return
-            if self.is_jumping():
+            if self.game.is_jumping():
                 self._draw_jump()
                 return
             if self.game.reached_goal():
@@ -134,97 +118,143 @@ class Player:
 
 
 class GameScene(Scene):
-    def __init__(self):
+    def __init__(self, dirty_rects: bool = True, level=None):
+        """
+        :param dirty_rects: Only update the parts of the display that changed instead of flipping the whole display
+        :param level: `Level` or `EndlessLevel` to play, defaults to a level of 5 obstacles
+        """
         super().__init__()
         
-        self.threshold = None
-        self.background_image = pygame.image.load("assets/Backgrounds/backgroundEmpty.png")
-        self.background_image = pygame.transform.scale(self.background_image, pygame.display.get_window_size())
+        self.dirty_rects = dirty_rects
+        self.background_image = assets.get(BACKGROUND_IMAGE, pygame.display.get_window_size())
 
-        self.ground_left = pygame.image.load("assets/PNG/Ground/Grass/grassLeft.png")
-        self.sand_right = pygame.image.load("assets/PNG/Ground/Sand/sandRight.png")
-        self.ground = pygame.image.load("assets/PNG/Ground/Grass/grassMid.png")
-        self.sand = pygame.image.load("assets/PNG/Ground/Sand/sandMid.png")
+        self.ground_left = assets.get(GROUND_LEFT_IMAGE)
+        self.sand_right = assets.get(SAND_RIGHT_IMAGE)
+        self.ground = assets.get(GROUND_IMAGE)
+        self.sand = assets.get(SAND_IMAGE)
 
-        self.cactus = pygame.image.load("assets/PNG/Tiles/cactus.png")
-        self.spikes = pygame.image.load("assets/PNG/Tiles/spikes.png")
+        self.cactus = assets.get(CACTUS_IMAGE)
+        self.spikes = assets.get(SPIKES_IMAGE)
 
-        self.star = pygame.image.load("assets/PNG/Items/star.png")
+        self.star = assets.get(STAR_IMAGE)
 
         self.tile_width = self.ground.get_width()
         self.tile_height = self.ground.get_height()
 
-        self.obstacle_no = 5
-        self.tiles_per_obstacle = 26  # (a little over) 5 seconds at 60 fps
-        self.start_tile = 31
+        player_size = assets.get(PLAYER_STAND_IMAGE).get_size()
+        self.game = GameState(level, pygame.display.get_window_size(), self.tile_width, player_size, log=self.log)
+        self.level = self.game.level
+        self.obstacle_no = self.level.obstacle_no  # None for an endless level
+        self.level_width = self.level.width  # in tiles
+        self.y = self.game.y
+
+        self.player = Player(self.game)
+        # An endless level has no goal to put the flag at
+        self.flag = Flag(self) if self.obstacle_no is not None else None
+        
+        # The level strip (ground and obstacles) is pre-rendered in chunks as they scroll into view
+        self.strip_top = self.y - max(self.cactus.get_height(), self.spikes.get_height())
+        self.chunk_width = CHUNK_TILES * self.tile_width
+        if self.obstacle_no is not None:
+            self.chunk_count = (self.level_width + CHUNK_TILES) // CHUNK_TILES
+        else:
+            self.chunk_count = math.inf
+        self._chunks = {}
+        
+        self._previous_rects = []
+        self._full_redraw = True
 
-        self.left_corner = 0
-        self.level_width = (self.tiles_per_obstacle - 8) + self.tiles_per_obstacle * self.obstacle_no  # in tiles
-        self.y = pygame.display.get_window_size()[1] - self.tile_height
+        # The game is simulated in fixed steps on a monotonic clock, so its timing does not depend on the frame rate
+        self.clock = time.perf_counter  # seconds on a monotonic clock, replaced by a simulated one in benchmarks
+        self._accumulator = 0.0
+        self._last_time = None
 
-        self.no_obstacles_hit = 0
+    @property
+    def started(self):
+        return self.game.started
 
-        self.player = Player(game=self, ground=self.y)
-        self.obstacles = self._generate_obstacles()
-        self.started = False
+    @started.setter
+    def started(self, started):
+        self.game.started = started
 
-        self.flag = Flag(self)
-        self.current_phase = None
+    @property
+    def current_phase(self):
+        return self.game.current_phase
 
-    def draw(self, screen, emg):
-        if self.started and self.threshold and emg > self.threshold and self.time_since_hit_gt(HIT_PENALTY + 2000):
-            self.player.jump()
-        # Only move player forward if the game is running and they are not under penalty
-        if self.started and self.time_since_hit_gt(HIT_PENALTY) and not self.reached_goal():
-            # Make jump a little faster to account for the extra tile with obstacle
-            if self.player.is_jumping():
-                self.left_corner -= GAME_SPEED * 1.2
-            else:
-                self.left_corner -= GAME_SPEED
+    @property
+    def threshold(self):
+        return self.game.threshold
+
+    def step(self):
+        """
+        Advances the game by one fixed simulation step.
+        """
+        self.game.step()
+
+    def advance(self):
+        """
+        Runs as many simulation steps as fit into the time since the last call.
+        :return: Fraction of a step the remaining time amounts to, to interpolate the drawn positions with
+        """
+        now = self.clock()
+        if self._last_time is None:
+            self._last_time = now
+        elapsed = now - self._last_time
+        self._last_time = now
+        if elapsed > MAX_CATCH_UP:
+            self.log("SimulationSkipped", round(elapsed - MAX_CATCH_UP, 3))
+            elapsed = MAX_CATCH_UP
+
+        self._accumulator += elapsed
+        while self._accumulator >= STEP:
+            self.step()
+            self._accumulator -= STEP
+        return self._accumulator / STEP
 
-        screen.fill(constants.BACKGROUND)
-        screen.blit(self.background_image, (0, 0))
+    def draw(self, screen, emg):
+        crossing = self.game.pending_crossing
+        if self.game.process_envelope(emg) and self.latency is not None:
+            self.latency.event(crossing.timestamp)
+        alpha = self.advance()
+        game = self.game
+        left_corner = game.previous_left_corner + (game.left_corner - game.previous_left_corner) * alpha
+
+        full_redraw = self._full_redraw or not self.dirty_rects
+        if full_redraw:
+            screen.fill(constants.BACKGROUND)
+            screen.blit(self.background_image, (0, 0))
+            self._full_redraw = False
+        else:
+            # Restore the background wherever something was drawn in the previous frame
+            for rect in self._previous_rects:
+                screen.fill(constants.BACKGROUND, rect)
+                screen.blit(self.background_image, rect, rect)
 
-        self._draw_ground(screen)
-        self._draw_obstacles(screen)
+        rects = self._draw_level(screen, left_corner)
 
-        self.player.draw(screen, self.started)
-        self.flag.draw(screen)
+        rects.append(self.player.draw(screen, alpha))
+        if self.flag is not None:
+            rects.append(self.flag.draw(screen, left_corner))
 
-        if self.reached_goal():
-            self._draw_end_screen(screen)
+        if game.reached_goal():
+            rects.extend(self._draw_end_screen(screen))
 
         self.update(screen)
 
         # Flip the display
-        pygame.display.flip()
+        self.present(None if full_redraw else self._previous_rects + rects)
+        self._previous_rects = rects
 
     def update(self, screen):
-        self.log_phase(self._get_phase())
-
         player_colour = constants.BLUE
         obstacle_colour = constants.YELLOW
         hit_colour = constants.RED
 
-        # Check for player <-> obstacle collision
-        padding = 15  # add some collision padding to give the player some slack and be more visually consistent
-        player_rect = pygame.Rect(self.player.x, self.player.y + self.tile_height + padding, self.tile_width - padding,
-                                  self.tile_height - padding * 2)
-        obstacle_rects = [pygame.Rect(obstacle[1] + self.left_corner + padding, self.y - self.tile_height + padding * 2,
-                                      self.tile_width - padding * 3, self.tile_height - padding * 2) for obstacle in
-                          self.obstacles]
-        hit_obstacle = player_rect.collidelist(obstacle_rects)
-
-        # Give player 2s to get out of the obstacle
-        hit_amnesty = not self.time_since_hit_gt(HIT_PENALTY + 2000)
-        if hit_obstacle >= 0 and not self.player.is_jumping():
-            if self.player.last_hit is None or not hit_amnesty:
-                self.player.hit()
-                self.no_obstacles_hit += 1
-
         debug = False
         if not debug:
             return
+        player_rect, obstacle_rects = self.game.collision_rects()
+        hit_obstacle = self.game.colliding_obstacle()
         for i, obstacle_rect in enumerate(obstacle_rects):
             colour = hit_colour if i == hit_obstacle else obstacle_colour
             pygame.draw.rect(screen, color=colour, rect=obstacle_rect)
@@ -232,103 +262,92 @@ class GameScene(Scene):
         pygame.draw.rect(screen, color=player_colour, rect=player_rect)
 
     def process_event(self, event):
+        # The whole window has to be redrawn after the display surface changed or the HUD was toggled
+        if event.type in (pygame.WINDOWEXPOSED, pygame.WINDOWSIZECHANGED) or (
+                event.type == pygame.KEYDOWN and event.key in (pygame.K_f, pygame.K_h)):
+            self._full_redraw = True
         if self.started:
             if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
-                self.player.jump()
+                self.game.jump()
         else:
             if event.type == pygame.KEYDOWN and event.key == pygame.K_s:
                 self.started = True
 
+    def process_crossing(self, crossing):
+        return self.game.process_crossing(crossing)
+
     def set_threshold(self, threshold):
-        if threshold != self.threshold:
-            self.log("Threshold", threshold)
-        self.threshold = threshold
-
-    def _get_phase(self):
-        if not self.started or self.reached_goal():
-            return "NotRunning"
-        non_jumpy_tiles = self.get_non_jumpy_tiles()
-        if self.current_game_tile() in non_jumpy_tiles:
-            return "Relax"
-        else:
-            return "MotorTask"
-
-    def log_phase(self, phase):
-        if phase != self.current_phase:
-            self.log("Phase", phase)
-            self.current_phase = phase
-
-    def _generate_obstacles(self):
-        obstacles = []
-        for i in range(0, self.obstacle_no):
-            x = self.tile_width * self.start_tile + self.tile_width * self.tiles_per_obstacle * i
-            if random.random() < 0.5:
-                obstacles.append(("CACTUS", x))
-            else:
-                obstacles.append(("SPIKES", x))
-        return obstacles
+        self.game.set_threshold(threshold)
 
-    def time_since_hit_gt(self, duration):
+    def _draw_level(self, screen, left_corner):
         """
-        Returns True if time since the player hit an obstacle last time is greater than the supplied duration in ms.
-        Otherwise, returns False.
+        Blits the chunks of the pre-rendered level strip that are visible on the screen.
+        :param left_corner: Interpolated scroll position to draw the level at
+        :return: Rectangles of the screen that were drawn over
         """
-        if self.player.last_hit is not None:
-            ticks = pygame.time.get_ticks()
-            return (ticks - self.player.last_hit) > duration
-        return True
-
-    def _draw_obstacles(self, screen):
-        a = self.left_corner
-        for obstacle in self.obstacles:
-            if obstacle[0] == "CACTUS":
-                screen.blit(self.cactus, (a + obstacle[1], self.y - self.cactus.get_height()))
-            elif obstacle[0] == "SPIKES":
-                screen.blit(self.spikes, (a + obstacle[1], self.y - self.spikes.get_height()))
-
-    def _draw_ground(self, screen):
-        a = self.left_corner
-        y = self.y
-
-        screen.blit(self.ground_left, (a, y))
-
-        non_jumpy_tiles = self.get_non_jumpy_tiles()
-        for i in range(1, self.level_width):
-            tile = self.sand if i in non_jumpy_tiles else self.ground
-            screen.blit(tile, (a + i * self.tile_width, y))
-        screen.blit(self.sand_right, (a + self.level_width * self.tile_width, y))
+        a = left_corner
+        first = max(0, int(-a // self.chunk_width))
+        last = min(self.chunk_count - 1, int((screen.get_width() - a) // self.chunk_width))
+
+        # The level only scrolls forward, chunks behind the camera won't be needed again
+        for chunk in [chunk for chunk in self._chunks if chunk < first]:
+            del self._chunks[chunk]
+
+        rects = []
+        for chunk in range(first, last + 1):
+            if chunk not in self._chunks:
+                self._chunks[chunk] = self._render_chunk(chunk)
+            rects.append(screen.blit(self._chunks[chunk], (a + chunk * self.chunk_width, self.strip_top)))
+        return rects
+
+    def _render_chunk(self, chunk):
+        """
+        :return: Surface with the ground tiles and obstacles of the given chunk of the level
+        """
+        surface = pygame.Surface((self.chunk_width, self.y + self.tile_height - self.strip_top), pygame.SRCALPHA)
+        y = self.y - self.strip_top
+
+        first_tile = chunk * CHUNK_TILES
+        for i in range(first_tile, min(first_tile + CHUNK_TILES, self.level_width + 1)):
+            if i == 0:
+                tile = self.ground_left
+            elif i == self.level_width:
+                tile = self.sand_right
+            else:
+                tile = self.ground if self.level.is_jumpy(i) else self.sand
+            surface.blit(tile, ((i - first_tile) * self.tile_width, y))
+
+        for obstacle in self.level.obstacles_between(first_tile, first_tile + CHUNK_TILES):
+            # Every obstacle is rendered once, its look only has to be picked then
+            image = self.cactus if random.random() < 0.5 else self.spikes
+            surface.blit(image, ((obstacle - first_tile) * self.tile_width, y - image.get_height()))
+        return surface.convert_alpha()
 
     def _draw_end_screen(self, screen):
-        obstacles_avoided = self.obstacle_no - self.no_obstacles_hit
+        obstacles_avoided = self.obstacle_no - self.game.no_obstacles_hit
         win_ratio = obstacles_avoided / self.obstacle_no
         no_stars = 3 if win_ratio > 0.9 else 2 if win_ratio > 0.5 else 1
 
+        rects = []
         for i in range(0, no_stars):
-            screen.blit(self.star, (pygame.display.get_window_size()[0] / 2 - self.star.get_width() * (
-                    no_stars - 1) / 2 + i * self.star.get_width(), pygame.display.get_window_size()[1] / 2))
+            rects.append(screen.blit(self.star, (pygame.display.get_window_size()[0] / 2 - self.star.get_width() * (
+                    no_stars - 1) / 2 + i * self.star.get_width(), pygame.display.get_window_size()[1] / 2)))
+        return rects
 
     def get_non_jumpy_tiles(self):
-        obstacle_tiles = self.get_obstacle_tiles()
-        preparation_tiles = []
-        for obstacle_tile in obstacle_tiles:
-            preparation_tiles.extend(
-                [obstacle_tile - i for i in range(self.tiles_per_obstacle - 14, self.tiles_per_obstacle)])
-        return obstacle_tiles + preparation_tiles + list(range(0, min(preparation_tiles))) + list(
-            range(max(obstacle_tiles), self.level_width))
+        return self.level.non_jumpy_tiles()
 
     def get_obstacle_tiles(self):
-        return [(self.start_tile + self.tiles_per_obstacle * i) for i in range(0, self.obstacle_no)]
+        return self.level.obstacle_tiles.tolist()
 
     def current_game_tile(self):
         """
         :return: The no. tile the player is currently on.
         """
-
-        return int((-self.left_corner + self.player.get_start_position()) / self.tile_width)
+        return self.game.current_game_tile()
 
     def reached_goal(self):
         """
         :return: True if the player has reached the goal, False otherwise.
         """
-
-        return self.current_game_tile() >= self.level_width
+        return self.game.reached_goal()
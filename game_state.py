@@ -0,0 +1,216 @@
+from level import Level
+
+TICK_RATE = 60  # no. of simulation steps per second, independent of the frame rate
+STEP = 1 / TICK_RATE
+GAME_SPEED = 4  # 2 tiles per second, in pixels per step
+GRAVITY = 0.062  # in pixels per step per step
+JUMP_VELOCITY = -10  # in pixels per step
+HIT_PENALTY = 3000  # 3s of penalty
+HIT_GRACE = 2000  # ms after the penalty in which the player can't be hit again or jump on a crossing
+COLLISION_PADDING = 15  # gives the player some slack and is more visually consistent
+
+
+class GameState:
+    """
+    Rules of the game without any rendering: scrolling, jumping, gravity, hits and the phase of the protocol, advanced
+    in fixed steps of a simulated clock. `GameScene` draws it live and `Replay` steps it through recordings, so both
+    play by exactly the same rules.
+    """
+
+    def __init__(self, level=None, window_size=(800, 600), tile_size: int = 128, player_size=(128, 256), log=None):
+        """
+        :param level: `Level` or `EndlessLevel` to play, defaults to a level of 5 obstacles
+        :param window_size: Size of the window in pixels
+        :param tile_size: Width and height of a tile in pixels
+        :param player_size: Width and height of the player in pixels
+        :param log: Function called with the type and the value of every event of the game, e.g. `Scene.log`
+        """
+        self.level = level if level is not None else Level()
+        self.tile_width = tile_size
+        self.tile_height = tile_size
+        self.y = window_size[1] - self.tile_height  # top of the ground
+
+        self.player_x = window_size[0] / 3 - player_size[0] / 2
+        self.player_ground = self.y - player_size[1]
+        self.player_y = self.player_ground
+        self.previous_player_y = self.player_y
+        self.vel_y = 0
+        self.last_hit = None
+
+        self.left_corner = 0
+        self.previous_left_corner = 0
+        self.ticks = 0  # simulated milliseconds
+        self.started = False
+        self.threshold = None
+        self.pending_crossing = None  # rejected crossing of a contraction that is still above the threshold
+        self._threshold_logged = False
+        self.current_phase = None
+        self.no_obstacles_hit = 0
+        self._log = log
+
+    def log(self, type_, value, timestamp=None):
+        if self._log is not None:
+            self._log(type_, value, timestamp)
+
+    def step(self):
+        """
+        Advances the game by one fixed simulation step.
+        """
+        self.ticks += 1000 * STEP
+        self.previous_left_corner = self.left_corner
+        # Only move player forward if the game is running and they are not under penalty
+        if self.started and self.time_since_hit_gt(HIT_PENALTY) and not self.reached_goal():
+            # Make jump a little faster to account for the extra tile with obstacle
+            if self.is_jumping():
+                self.left_corner -= GAME_SPEED * 1.2
+            else:
+                self.left_corner -= GAME_SPEED
+
+        self.previous_player_y = self.player_y
+        self.player_y += self.vel_y
+        self.vel_y += GRAVITY
+        if self.player_y > self.player_ground:
+            self.player_y = self.player_ground
+            self.vel_y = 0
+
+        # Tiles behind the player are never looked up again
+        self.level.release(self.current_game_tile() - 1)
+        self.log_phase(self._get_phase())
+        self._check_collision()
+
+    def jump(self, sample_timestamp=None):
+        """
+        :param sample_timestamp: BrainFlow timestamp of the sample that triggered the jump, if any
+        :return: True if the player jumped
+        """
+        # Only allow jumping if the game is running
+        if self.reached_goal():
+            return False
+        # No double jump allowed
+        if self.is_jumping():
+            return False
+        # Only allow jumping in the motor task (perform) phase
+        if not self.level.is_jumpy(self.current_game_tile()):
+            return False
+        # Only allow jumping if we are not under penalty
+        if self.time_since_hit_gt(HIT_PENALTY):
+            self.log("PlayerJump", sample_timestamp)
+            self.vel_y = JUMP_VELOCITY
+            return True
+        return False
+
+    def process_crossing(self, crossing):
+        """
+        :return: True if the crossing of the threshold made the player jump
+        """
+        if self._reacts_to_signal() and self.jump(crossing.timestamp):
+            self.pending_crossing = None
+            return True
+        self.pending_crossing = crossing
+        return False
+
+    def process_envelope(self, envelope):
+        """
+        Retries the pending crossing while the filtered signal stays above the threshold. A contraction whose crossing
+        was rejected, e.g. because it started before a jumpy tile or under penalty, still makes the player jump once
+        they can. Without a pending crossing nothing happens, a new jump needs a new crossing.
+        :param envelope: Latest sample of the filtered signal
+        :return: True if the player jumped on the pending crossing
+        """
+        if self.pending_crossing is None:
+            return False
+        if envelope is None or not self.threshold or envelope <= self.threshold:
+            self.pending_crossing = None
+            return False
+        if self._reacts_to_signal() and self.jump(self.pending_crossing.timestamp):
+            self.pending_crossing = None
+            return True
+        return False
+
+    def _reacts_to_signal(self):
+        # The penalty after a hit is enforced here, not by the refractory period of the crossing detector, which only
+        # keeps the game from getting more than one crossing per step
+        return self.started and self.threshold and self.time_since_hit_gt(HIT_PENALTY + HIT_GRACE)
+
+    def set_threshold(self, threshold):
+        self.threshold = threshold
+        # The threshold follows the baseline all through Relax, only the one the motor task is judged by is logged
+        if self.current_phase == "MotorTask" and not self._threshold_logged:
+            self.log("Threshold", threshold)
+            self._threshold_logged = True
+
+    def _get_phase(self):
+        if not self.started or self.reached_goal():
+            return "NotRunning"
+        return self.level.phase(self.current_game_tile())
+
+    def log_phase(self, phase):
+        if phase != self.current_phase:
+            self.log("Phase", phase)
+            self.current_phase = phase
+            self._threshold_logged = False
+
+    def collision_rects(self):
+        """
+        :return: Rectangle of the player and of the obstacles next to them as `(left, top, width, height)`, the other
+        obstacles can't collide with the player
+        """
+        padding = COLLISION_PADDING
+        player_rect = (self.player_x, self.player_y + self.tile_height + padding, self.tile_width - padding,
+                       self.tile_height - padding * 2)
+        tile = self.current_game_tile()
+        obstacle_rects = [(obstacle * self.tile_width + self.left_corner + padding,
+                           self.y - self.tile_height + padding * 2, self.tile_width - padding * 3,
+                           self.tile_height - padding * 2) for obstacle in
+                          self.level.obstacles_between(tile - 1, tile + 2)]
+        return player_rect, obstacle_rects
+
+    def colliding_obstacle(self):
+        """
+        :return: Index of the obstacle of `collision_rects` the player collides with, or -1
+        """
+        # Same as `pygame.Rect.collidelist`, whose rectangles have integer coordinates
+        (left, top, width, height), obstacle_rects = self.collision_rects()
+        left, top = int(left), int(top)
+        for i, (obstacle_left, obstacle_top, obstacle_width, obstacle_height) in enumerate(obstacle_rects):
+            obstacle_left, obstacle_top = int(obstacle_left), int(obstacle_top)
+            if (left < obstacle_left + obstacle_width and obstacle_left < left + width and
+                    top < obstacle_top + obstacle_height and obstacle_top < top + height):
+                return i
+        return -1
+
+    def _check_collision(self):
+        # Give player 2s to get out of the obstacle
+        hit_amnesty = not self.time_since_hit_gt(HIT_PENALTY + HIT_GRACE)
+        if not self.is_jumping() and self.colliding_obstacle() >= 0:
+            if self.last_hit is None or not hit_amnesty:
+                self.log("PlayerHit", None)
+                self.last_hit = self.ticks
+                # Reset the velocity if we have hit corner
+                self.vel_y = 0
+                self.no_obstacles_hit += 1
+
+    def is_jumping(self):
+        # A jump takes off with the next step
+        return self.player_y < self.player_ground or self.vel_y < 0
+
+    def time_since_hit_gt(self, duration):
+        """
+        Returns True if simulated time since the player hit an obstacle last time is greater than the supplied duration
+        in ms. Otherwise, returns False.
+        """
+        if self.last_hit is not None:
+            return (self.ticks - self.last_hit) > duration
+        return True
+
+    def current_game_tile(self):
+        """
+        :return: The no. tile the player is currently on.
+        """
+        return int((-self.left_corner + self.player_x) / self.tile_width)
+
+    def reached_goal(self):
+        """
+        :return: True if the player has reached the goal, False otherwise.
+        """
+        return self.current_game_tile() >= self.level.width
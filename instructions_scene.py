@@ -3,36 +3,32 @@ import time
 import pygame
 
 import constants
+from protocol import NOT_RUNNING, Protocol
 from scene import Scene
 
-NOT_RUNNING = "Not running"
-PREPARE = "Forbered dig på bevægelse"
-MOTOR_TASK = "Bevæg håndledet"
-RELAX = "Slap af"
-
 
 class TimingTask:
-    def __init__(self, scene, no_attempts=5, prepare_phase: int = 2, motor_task_phase: int = 5, relax_phase: int = 5, ):
+    def __init__(self, scene, no_attempts=5, prepare_phase: int = 2, motor_task_phase: int = 5, relax_phase: int = 5,
+                 protocol: Protocol = None):
         """
         :param no_attempts: The number of attempts to perform the motor imagery task
         :param prepare_phase: Number of seconds to prepare
         :param motor_task_phase: Number of seconds to perform the motor imagery task
         :param relax_phase: Number of seconds to relax
+        :param protocol: Sequence of phases to run instead of the attempts above
         """
         super().__init__()
         self.scene = scene
-        self.no_attempts = no_attempts
-        self.prepare_phase = prepare_phase
-        self.motor_task_phase = motor_task_phase
-        self.relax_phase = relax_phase
+        if protocol is None:
+            protocol = Protocol.default(no_attempts, prepare_phase, motor_task_phase, relax_phase)
+        self.protocol = protocol
         self.clock_start = None
 
         self.current_phase = None
-
-        self.attempt_duration = self.prepare_phase + self.motor_task_phase + self.relax_phase
+        self.phase = None  # `Phase` of the protocol the task is in, None if it is not running
 
     def start(self):
-        self.clock_start = time.time()
+        self.clock_start = time.monotonic()
         self.scene.log("InstructionStart", None)
 
     def stop(self):
@@ -40,29 +36,18 @@ class TimingTask:
         self.scene.log("InstructionStop", None)
 
     def get_phase(self):
+        self.phase = None
         if self.clock_start is None:
             return NOT_RUNNING, None, None, None
 
-        now = time.time()
-        elapsed = now - self.clock_start
-
-        full_attempts = int(elapsed / self.attempt_duration)
-        partial_attempt = elapsed % self.attempt_duration
-
-        if full_attempts >= self.no_attempts:
+        current = self.protocol.phase_at(time.monotonic() - self.clock_start)
+        if current is None:
             self._log_phase("NotRunning")
             return NOT_RUNNING, None, None, None
-        if partial_attempt < self.prepare_phase:
-            self._log_phase("Prepare")
-            return PREPARE, self.prepare_phase - partial_attempt, self.prepare_phase, constants.YELLOW
-        elif partial_attempt < self.prepare_phase + self.motor_task_phase:
-            self._log_phase("MotorTask")
-            return MOTOR_TASK, self.prepare_phase + self.motor_task_phase - partial_attempt, self.motor_task_phase, constants.BLUE
-        elif partial_attempt < self.prepare_phase + self.motor_task_phase + self.relax_phase:
-            self._log_phase("Relax")
-            return RELAX, self.prepare_phase + self.motor_task_phase + self.relax_phase - partial_attempt, self.relax_phase, constants.GREEN
-        self._log_phase("NotRunning")
-        return NOT_RUNNING, None, None, None
+        phase, seconds_left = current
+        self.phase = phase
+        self._log_phase(phase.name)
+        return phase.text, seconds_left, phase.duration, phase.colour
 
     def _log_phase(self, phase):
         if phase != self.current_phase:
@@ -75,11 +60,21 @@ class InstructionScene(Scene):
     Displays the instructions for motor imagery without giving any feedback.
     """
 
-    def __init__(self):
+    def __init__(self, protocol: Protocol = None):
+        """
+        :param protocol: Sequence of phases to instruct, defaults to 5 attempts of `TimingTask`
+        """
         super().__init__()
 
         self.font = pygame.font.SysFont('Arial', 30)
-        self.timing_task = TimingTask(self)
+        self.timing_task = TimingTask(self, protocol=protocol)
+        # The instructions and bars only change a few times per attempt, render them once
+        self._text_cache = {}
+        self._bar_cache = {}
+
+    @property
+    def current_phase(self):
+        return self.timing_task.current_phase
 
     def draw(self, screen, _emg):
         # Fill the background with white
@@ -88,7 +83,7 @@ class InstructionScene(Scene):
         self._draw_instructions(screen)
 
         # Flip the display
-        pygame.display.flip()
+        self.present()
 
     def process_event(self, event):
         if event.type == pygame.KEYDOWN and event.key == pygame.K_s:
@@ -100,12 +95,18 @@ class InstructionScene(Scene):
 
         phase, seconds_left, total_phase_time, colour = self.timing_task.get_phase()
 
-        phase_surf = self.font.render(phase, True, constants.TEXT)
+        phase_surf = self._text_cache.get(phase)
+        if phase_surf is None:
+            phase_surf = self._text_cache[phase] = self.font.render(phase, True, constants.TEXT)
         screen.blit(phase_surf, (center[0] - phase_surf.get_width() / 2, center[1] - phase_surf.get_height() / 2 - 100))
 
         if seconds_left is not None and total_phase_time is not None and colour is not None:
             max_width = size[0] * 0.5
             width = max_width * (seconds_left / total_phase_time)
-            # Don't draw a bar if the phase is PREPARE because it's too short
-            if phase != PREPARE:
-                pygame.draw.rect(screen, colour, pygame.Rect(center[0] - max_width / 2, center[1], width, 30))
\ No newline at end of file
+            # Some phases, e.g. Prepare, are too short for a bar
+            if self.timing_task.phase.bar:
+                bar = self._bar_cache.get((colour, int(max_width)))
+                if bar is None:
+                    bar = self._bar_cache[(colour, int(max_width))] = pygame.Surface((int(max_width), 30))
+                    bar.fill(colour)
+                screen.blit(bar, (center[0] - max_width / 2, center[1]), pygame.Rect(0, 0, width, 30))
\ No newline at end of file
@@ -0,0 +1,83 @@
+import atexit
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+_STOP = object()
+
+
+class InteractionLog:
+    """
+    Writes interaction events to a CSV file in batches from a background writer thread, so that logging never blocks
+    the render loop. Every record carries the wall-clock (UTC) and the monotonic time at which it was logged.
+    """
+
+    def __init__(self, path: str, batch_size: int = 256, flush_interval: float = 0.5):
+        """
+        :param path: Path of the CSV file to write
+        :param batch_size: Number of records after which the file is flushed
+        :param flush_interval: Maximum number of seconds a record waits before the file is flushed
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.f = open(path, "w")
+        self.f.write("timestamp;type;value;monotonic\n")
+
+        self._queue = queue.SimpleQueue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="interaction-log", daemon=True)
+        self._thread.start()
+        # `__del__` is not guaranteed to run, make sure everything is written when the interpreter exits
+        atexit.register(self.close)
+
+    def log(self, type_, value, timestamp=None):
+        """
+        :param type_: Type of the event
+        :param value: Value of the event
+        :param timestamp: UTC datetime of the event, defaults to now
+        """
+        if self._closed:
+            return
+        self._queue.put((timestamp if timestamp is not None else time.time(), time.monotonic(), type_, value))
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        self.f.close()
+        atexit.unregister(self.close)
+
+    def _run(self):
+        batch = []
+        last_flush = time.monotonic()
+        while True:
+            timeout = max(0.0, last_flush + self.flush_interval - time.monotonic())
+            try:
+                record = self._queue.get(timeout=timeout) if batch else self._queue.get()
+            except queue.Empty:
+                record = None
+
+            if record is _STOP:
+                self._write(batch)
+                return
+            if record is not None:
+                batch.append(record)
+
+            if len(batch) >= self.batch_size or (batch and time.monotonic() - last_flush >= self.flush_interval):
+                self._write(batch)
+                batch = []
+                last_flush = time.monotonic()
+
+    def _write(self, batch):
+        lines = []
+        for timestamp, monotonic, type_, value in batch:
+            if not isinstance(timestamp, datetime):
+                timestamp = datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+            lines.append(f"{timestamp};{type_};{value};{monotonic:.6f}\n")
+        self.f.write("".join(lines))
+        self.f.flush()
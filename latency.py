@@ -0,0 +1,124 @@
+import time
+
+import numpy as np
+
+STAGES = ("acquired", "filtered", "presented", "feedback")
+
+
+class LatencyHistogram:
+    """
+    Histogram of latencies with fixed-width bins, cheap enough to fill every frame. Percentiles are read from the
+    bins, so they are exact up to the resolution.
+    """
+
+    def __init__(self, max_latency: float = 2.0, resolution: float = 0.0005):
+        """
+        :param max_latency: Largest latency in seconds with its own bin, longer ones are counted in the last bin
+        :param resolution: Width of a bin in seconds
+        """
+        self.resolution = resolution
+        self.counts = np.zeros(int(np.ceil(max_latency / resolution)) + 1, dtype=np.int64)
+        self.count = 0
+        self.max = None
+
+    def add(self, latencies):
+        """
+        :param latencies: Latency or array of latencies in seconds
+        """
+        latencies = np.atleast_1d(np.asarray(latencies, dtype=float))
+        if len(latencies) == 0:
+            return
+        bins = np.clip((latencies / self.resolution).astype(np.int64), 0, len(self.counts) - 1)
+        np.add.at(self.counts, bins, 1)
+        self.count += len(latencies)
+        latest_max = float(latencies.max())
+        self.max = latest_max if self.max is None else max(self.max, latest_max)
+
+    def percentile(self, q: float):
+        """
+        :param q: Percentile between 0 and 100
+        :return: Upper edge of the bin holding the percentile in seconds, or None if the histogram is empty
+        """
+        if self.count == 0:
+            return None
+        i = int(np.searchsorted(np.cumsum(self.counts), q / 100 * self.count, side="left"))
+        return min((i + 1) * self.resolution, self.max)
+
+    def summary(self, percentiles=(50, 90, 99)):
+        """
+        :return: Dictionary with the count, the percentiles and the maximum in milliseconds
+        """
+        summary = {"n": self.count}
+        if self.count:
+            for q in percentiles:
+                summary[f"p{q}"] = round(self.percentile(q) * 1000, 1)
+            summary["max"] = round(self.max * 1000, 1)
+        return summary
+
+
+class LatencyTracker:
+    """
+    Measures how old the samples are, by their BrainFlow timestamp, when they pass each stage of the pipeline:
+    `acquired` when the board data is read (every sample), `filtered` after the filter and the threshold update (the
+    newest sample of the block), `presented` when the frame showing it is flipped, and `feedback` from the sample that
+    crossed the threshold to the flip of the frame showing the jump.
+    """
+
+    def __init__(self, clock=time.time, max_latency: float = 2.0, resolution: float = 0.0005):
+        """
+        :param clock: Function returning the time on the same clock as the BrainFlow timestamps
+        :param max_latency: See `LatencyHistogram`
+        :param resolution: See `LatencyHistogram`
+        """
+        self.clock = clock
+        self.histograms = {stage: LatencyHistogram(max_latency, resolution) for stage in STAGES}
+        self._newest = None
+        self._events = []
+
+    def samples(self, stage: str, timestamps):
+        """
+        Records the latency of every sample.
+        """
+        if timestamps is not None and len(timestamps):
+            self.histograms[stage].add(self.clock() - np.asarray(timestamps))
+
+    def block(self, stage: str, timestamps):
+        """
+        Records the latency of the newest sample, which is shown by the next presented frame.
+        """
+        if timestamps is None or not len(timestamps):
+            return
+        self._newest = timestamps[-1]
+        self.histograms[stage].add(self.clock() - self._newest)
+
+    def event(self, timestamp):
+        """
+        Marks feedback triggered by the sample with the timestamp, recorded when the next frame is presented.
+        """
+        if timestamp is not None:
+            self._events.append(timestamp)
+
+    def presented(self):
+        """
+        Called right after the display was flipped.
+        """
+        now = self.clock()
+        if self._newest is not None:
+            self.histograms["presented"].add(now - self._newest)
+            self._newest = None
+        if self._events:
+            self.histograms["feedback"].add(now - np.array(self._events))
+            self._events = []
+
+    def summaries(self):
+        """
+        :return: Dictionary with the summary of every stage
+        """
+        return {stage: histogram.summary() for stage, histogram in self.histograms.items()}
+
+    def log(self, scene):
+        """
+        Writes the summary of every stage to the interaction log of the scene, in milliseconds.
+        """
+        for stage, summary in self.summaries().items():
+            scene.log(f"Latency_{stage}", " ".join(f"{key}={value}" for key, value in summary.items()))
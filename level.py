@@ -0,0 +1,206 @@
+import bisect
+import itertools
+import math
+import random
+from collections import deque
+
+import numpy as np
+
+# Tile types
+MOTOR_TASK = 0
+RELAX = 1
+OBSTACLE = 2
+
+PHASES = {MOTOR_TASK: "MotorTask", RELAX: "Relax", OBSTACLE: "Relax"}
+
+
+class Level:
+    """
+    Layout of a level, computed once. Every tile has a type which determines the phase of the protocol while the
+    player is on it, so looking up the phase or whether jumping is allowed is a constant-time list index.
+    """
+
+    def __init__(self, obstacle_no: int = 5, tiles_per_obstacle: int = 26, start_tile: int = 31):
+        """
+        :param obstacle_no: Number of obstacles in the level
+        :param tiles_per_obstacle: Number of tiles between two obstacles
+        :param start_tile: Tile of the first obstacle
+        """
+        self.obstacle_no = obstacle_no
+        self.tiles_per_obstacle = tiles_per_obstacle
+        self.start_tile = start_tile
+        self.width = (tiles_per_obstacle - 8) + tiles_per_obstacle * obstacle_no  # in tiles
+
+        self.obstacle_tiles = start_tile + tiles_per_obstacle * np.arange(obstacle_no)
+        self.tile_types = self._create_tile_types()
+
+        # Plain lists are faster than NumPy arrays to index with a single tile
+        self._jumpy = (self.tile_types == MOTOR_TASK).tolist()
+        self._phases = [PHASES[tile_type] for tile_type in self.tile_types.tolist()]
+
+    def _create_tile_types(self):
+        tile_types = np.full(self.width, MOTOR_TASK, dtype=np.uint8)
+        if self.obstacle_no == 0:
+            tile_types[:] = RELAX
+            return tile_types
+
+        # Relax before every obstacle, during the first stretch of the level and after the last obstacle
+        preparation_tiles = (self.obstacle_tiles[:, np.newaxis] -
+                             np.arange(self.tiles_per_obstacle - 14, self.tiles_per_obstacle)).ravel()
+        tile_types[:max(preparation_tiles.min(), 0)] = RELAX
+        preparation_tiles = preparation_tiles[(preparation_tiles >= 0) & (preparation_tiles < self.width)]
+        tile_types[preparation_tiles] = RELAX
+        tile_types[self.obstacle_tiles.max():] = RELAX
+        tile_types[self.obstacle_tiles[self.obstacle_tiles < self.width]] = OBSTACLE
+        return tile_types
+
+    def is_jumpy(self, tile: int):
+        """
+        :return: True if jumping is allowed on the tile, i.e. it belongs to the motor task phase
+        """
+        if 0 <= tile < self.width:
+            return self._jumpy[tile]
+        return True
+
+    def phase(self, tile: int):
+        """
+        :return: "Relax" or "MotorTask" depending on the phase of the protocol on the tile
+        """
+        if 0 <= tile < self.width:
+            return self._phases[tile]
+        return "MotorTask"
+
+    def non_jumpy_tiles(self):
+        """
+        :return: List of the tiles on which jumping is not allowed
+        """
+        return np.flatnonzero(self.tile_types != MOTOR_TASK).tolist()
+
+    def obstacles_between(self, first: int, stop: int):
+        """
+        :return: List of the obstacle tiles from `first` up to but not including `stop`
+        """
+        return self.obstacle_tiles[np.searchsorted(self.obstacle_tiles, first):
+                                   np.searchsorted(self.obstacle_tiles, stop)].tolist()
+
+    def release(self, tile: int):
+        """
+        Tells the level that the tiles before `tile` won't be needed again. The whole level is kept.
+        """
+
+
+class EndlessLevel:
+    """
+    Level without an end, generated in chunks of tiles shortly before the player gets to them. The chunks and obstacles
+    the player has passed are dropped with `release`, so the memory and the cost of a lookup stay the same no matter
+    how long the session runs. Every obstacle follows `tiles_per_obstacle - 15` MotorTask tiles, the tiles before
+    those are Relax, like in `Level`.
+    """
+
+    def __init__(self, tiles_per_obstacle: int = 26, start_tile: int = 31, jitter: int = 0, seed=None,
+                 chunk_tiles: int = 64):
+        """
+        :param tiles_per_obstacle: Average number of tiles between two obstacles
+        :param start_tile: Tile of the first obstacle
+        :param jitter: Maximum number of tiles the distance between two obstacles varies by, which varies the length
+        of the Relax phases
+        :param seed: Seed of the jitter
+        :param chunk_tiles: Number of tiles generated at once
+        """
+        if jitter < 0:
+            raise ValueError(f"Jitter must not be negative: {jitter}")
+        self.tiles_per_obstacle = tiles_per_obstacle
+        self.start_tile = start_tile
+        self.jitter = min(jitter, tiles_per_obstacle - 16)  # at least one Relax tile between two obstacles
+        self.chunk_tiles = chunk_tiles
+        self.obstacle_no = None
+        self.width = math.inf  # in tiles
+        self.motor_task_tiles = tiles_per_obstacle - 15
+
+        self._random = random.Random(seed)
+        self._obstacles = deque([start_tile])  # generated obstacle tiles that have not been released
+        self._chunks = {}  # first tile of the chunk -> tile types of the chunk
+        self._released = 0  # tiles before this one have been released
+
+    def _chunk(self, tile: int):
+        first = tile - tile % self.chunk_tiles
+        tile_types = self._chunks.get(first)
+        if tile_types is None:
+            if first < self._released - self._released % self.chunk_tiles:
+                raise ValueError(f"Tile {tile} has been released")
+            tile_types = self._generate(first)
+            self._chunks[first] = tile_types
+        return first, tile_types
+
+    def _generate_obstacles(self, stop: int):
+        # Obstacles are generated in order, up to the first one at or after `stop`
+        while self._obstacles[-1] < stop:
+            gap = self.tiles_per_obstacle + self._random.randint(-self.jitter, self.jitter)
+            self._obstacles.append(self._obstacles[-1] + gap)
+
+    def _generate(self, first: int):
+        stop = first + self.chunk_tiles
+        self._generate_obstacles(stop)
+        obstacles = np.array(self._obstacles)
+        tiles = np.arange(first, stop)
+        # Distance of every tile to the next obstacle
+        distance = obstacles[np.searchsorted(obstacles, tiles)] - tiles
+        tile_types = np.where(distance == 0, OBSTACLE, np.where(distance <= self.motor_task_tiles, MOTOR_TASK, RELAX))
+        return (tile_types == MOTOR_TASK).tolist(), [PHASES[tile_type] for tile_type in tile_types.tolist()]
+
+    def is_jumpy(self, tile: int):
+        """
+        :return: True if jumping is allowed on the tile, i.e. it belongs to the motor task phase
+        """
+        if tile < 0:
+            return True
+        first, (jumpy, _) = self._chunk(tile)
+        return jumpy[tile - first]
+
+    def phase(self, tile: int):
+        """
+        :return: "Relax" or "MotorTask" depending on the phase of the protocol on the tile
+        """
+        if tile < 0:
+            return "MotorTask"
+        first, (_, phases) = self._chunk(tile)
+        return phases[tile - first]
+
+    @property
+    def obstacle_tiles(self):
+        """
+        :return: Obstacle tiles that have been generated and not released yet
+        """
+        return np.array(self._obstacles)
+
+    def non_jumpy_tiles(self):
+        """
+        :return: List of the tiles on which jumping is not allowed, of the chunks that have been generated and not
+        released yet
+        """
+        return [first + i for first, (jumpy, _) in sorted(self._chunks.items()) for i, j in enumerate(jumpy) if not j]
+
+    def obstacles_between(self, first: int, stop: int):
+        """
+        :return: List of the obstacle tiles from `first` up to but not including `stop`
+        """
+        # Tiles before the start of the level have never been generated, not released
+        if first < self._released and self._released > 0:
+            raise ValueError(f"Tile {first} has been released")
+        self._generate_obstacles(stop)
+        obstacles = self._obstacles
+        return [tile for tile in itertools.islice(obstacles, bisect.bisect_left(obstacles, first),
+                                                  bisect.bisect_left(obstacles, stop))]
+
+    def release(self, tile: int):
+        """
+        Drops the chunks and obstacles before `tile`, they can't be looked up afterwards.
+        """
+        if tile <= self._released:
+            return
+        self._released = tile
+        for first in [first for first in self._chunks if first + self.chunk_tiles <= tile]:
+            del self._chunks[first]
+        # The last obstacle is kept to generate the next ones from
+        while len(self._obstacles) > 1 and self._obstacles[0] < tile:
+            self._obstacles.popleft()
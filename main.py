@@ -1,56 +1,127 @@
 import argparse
 import os
+import subprocess
+import sys
 from datetime import datetime
 
-import matplotlib.pyplot as plt
-
-from filter import Filter
+from acquisition import Acquisition, update_baseline, get_threshold, detect_crossings, publish
+from crossing import CrossingDetector
+from filter import Filter, FilterBank
 from flow import Flow
+from latency import LatencyTracker
+from profiler import FrameProfiler
+import report
+from shm_stream import StreamPublisher, DEFAULT_NAME
 
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "hide"
 import pygame
 from scene import Scene
 from instructions_scene import InstructionScene
-from game_scene import GameScene
+from protocol import load_protocol
+from game_scene import GameScene, preload_assets
+from game_state import STEP
+from level import EndlessLevel
 
 
-def create_scene(mode):
+def create_scene(mode, protocol_file=None, endless=False, jitter=0):
     if mode == "game":
-        return GameScene()
+        return GameScene(level=EndlessLevel(jitter=jitter) if endless else None)
     elif mode == "instructions":
-        return InstructionScene()
+        return InstructionScene(load_protocol(protocol_file) if protocol_file else None)
     else:
         raise ValueError(f"Unknown mode: {mode}")
 
 
-def create_flow(mode, channel, input_, file_):
+def preload_scene_assets(mode):
+    if mode == "game":
+        preload_assets()
+    elif mode != "instructions":
+        raise ValueError(f"Unknown mode: {mode}")
+
+
+def create_flow(mode, channel, input_, file_, record, poll_limit):
     if input_ not in ["cyton", "playback", "openbci"]:
         raise ValueError(f"Unknown input: {input_}")
-    return Flow(mode=mode, channel=channel, input_=input_, file_=file_)
+    if record not in ["csv", "binary"]:
+        raise ValueError(f"Unknown recording format: {record}")
+    return Flow(mode=mode, channel=channel, input_=input_, file_=file_, record=record, poll_limit=poll_limit)
+
+
+def create_filter(sample_rate, channels, combine, retention, spill_prefix, baseline_half_life, envelope=None):
+    if channels is None:
+        return Filter(sampling_frequency=sample_rate, bandpass_low=30, bandpass_high=45, retention=retention,
+                      spill_prefix=spill_prefix, baseline_half_life=baseline_half_life, envelope=envelope)
+    if combine not in ["mean", "max"]:
+        combine = int(combine)
+    return FilterBank(channels=channels, sampling_frequency=sample_rate, bandpass_low=30, bandpass_high=45,
+                      retention=retention, spill_prefix=spill_prefix, baseline_half_life=baseline_half_life,
+                      combine=combine, envelope=envelope)
 
 
 def adapt_threshold(scene: GameScene, emg_filter: Filter):
-    if scene.current_phase == "Relax":
-        emg_filter.mark_as_baseline()
-    elif scene.current_phase == "MotorTask":
-        emg_filter.mark_as_NOT_baseline()
-        emg_filter.reset_baseline()
-    if emg_filter.baseline is not None:
-        scene.set_threshold(emg_filter.baseline + emg_filter.baseline_std * 3)
+    update_baseline(scene.current_phase, emg_filter)
+    threshold = get_threshold(emg_filter)
+    if threshold is not None:
+        scene.set_threshold(threshold)
 
 
 def main():
     arg_parser = argparse.ArgumentParser(description="BCI calibration")
     arg_parser.add_argument("--mode", help="'instructions' (default) or 'game'", default="instructions")
+    arg_parser.add_argument("--protocol", default=None,
+                            help="JSON file with the phases of the instructions. Default is 5 attempts of 2 s Prepare, "
+                                 "5 s MotorTask and 5 s Relax")
+    arg_parser.add_argument("--endless", action="store_true", default=False,
+                            help="Play an endless level in game mode instead of five obstacles")
+    arg_parser.add_argument("--jitter", type=int, default=0,
+                            help="Tiles the distance between the obstacles of --endless varies by. Default is 0")
     arg_parser.add_argument("--input", help="'cyton' (default), 'playback' or 'openbci'", default="cyton")
     arg_parser.add_argument("--file", help="The file to playback", default="examples/example_1.csv")
+    arg_parser.add_argument("--record", help="Format to record the session in: 'csv' (default) or 'binary'",
+                            default="csv")
+    arg_parser.add_argument("--poll-limit", type=int, default=None,
+                            help="Take at most this many samples from the board per poll")
     arg_parser.add_argument("--fullscreen", action="store_true", help="Run in fullscreen mode", default=False)
+    arg_parser.add_argument("--fps", type=int, default=60,
+                            help="Maximum frame rate of the display. The game runs at the same speed regardless. "
+                                 "Default is 60")
     arg_parser.add_argument("--channel", type=int,
                             help="no. of channel that contains the EMG channel to track. Default is 1", default=1)
+    arg_parser.add_argument("--channels", type=int, nargs="+",
+                            help="no. of channels to filter together. Overrides --channel if provided", default=None)
+    arg_parser.add_argument("--combine", default="mean",
+                            help="How to combine the --channels for the threshold: 'mean' (default), 'max' or a channel")
+    arg_parser.add_argument("--baseline-half-life", type=float, default=None,
+                            help="Estimate the baseline from all the Relax phases, halving the weight of a sample "
+                                 "every this many seconds. Default is the last 3 seconds of Relax only")
+    arg_parser.add_argument("--envelope", default=None,
+                            help="Envelope detector to use instead of the mean filter: 'mean', 'rms', 'tkeo', "
+                                 "'exponential' or 'hilbert'. Compare them with envelope.py")
+    arg_parser.add_argument("--threaded", action="store_true", default=False,
+                            help="Poll and filter the signal on a background thread, separately from rendering")
+    arg_parser.add_argument("--retention", type=float,
+                            help="Seconds of the filtered signal to keep in memory. Default is 600", default=600)
+    arg_parser.add_argument("--spill", action="store_true", default=False,
+                            help="Write the full filtered signal history to logs/ to plot the whole session")
+    arg_parser.add_argument("--publish", nargs="?", const=DEFAULT_NAME, default=None,
+                            help=f"Publish the filtered signal, the phase and the threshold to shared memory for other "
+                                 f"processes, under this name (default {DEFAULT_NAME})")
+    arg_parser.add_argument("--dashboard", action="store_true", default=False,
+                            help="Show a live plot of the signal for the experimenter in a separate process. "
+                                 "Implies --publish")
+    arg_parser.add_argument("--show-plots", action="store_true", default=False,
+                            help="Show the plots of the signal in interactive windows at the end")
+    
+    if arg_parser.parse_args().jitter < 0:
+        arg_parser.error("--jitter must not be negative")
     
     os.makedirs("logs", exist_ok=True)
     CHANNEL = arg_parser.parse_args().channel
-    print(f"Using channel {CHANNEL}")
+    CHANNELS = arg_parser.parse_args().channels
+    if CHANNELS is None:
+        print(f"Using channel {CHANNEL}")
+    else:
+        print(f"Using channels {CHANNELS}")
     
     pygame.init()
     pygame.display.set_caption("BCI calibration")
@@ -60,63 +131,165 @@ def main():
         screen = pygame.display.set_mode((800, 600))
     
     try:
-        scene: Scene = create_scene(arg_parser.parse_args().mode)
+        preload_scene_assets(arg_parser.parse_args().mode)
     except ValueError as e:
         print(e)
         return
     
+    # The assets keep loading in the background while the board session is being prepared
     flow = create_flow(mode=arg_parser.parse_args().mode, channel=CHANNEL, input_=arg_parser.parse_args().input,
-                       file_=arg_parser.parse_args().file)
+                       file_=arg_parser.parse_args().file, record=arg_parser.parse_args().record,
+                       poll_limit=arg_parser.parse_args().poll_limit)
     flow.start()
+    scene: Scene = create_scene(arg_parser.parse_args().mode, arg_parser.parse_args().protocol,
+                                arg_parser.parse_args().endless, arg_parser.parse_args().jitter)
     scene.log("EMGstart", None, flow.now)
     
-    emg_filter = Filter(sampling_frequency=flow.get_sample_rate(), bandpass_low=30, bandpass_high=45)
+    spill_prefix = None
+    if arg_parser.parse_args().spill:
+        spill_prefix = f"logs/{flow.now.strftime('%Y-%m-%d-%H-%M-%S')}_{arg_parser.parse_args().mode}"
+    try:
+        emg_filter = create_filter(flow.get_sample_rate(), CHANNELS, arg_parser.parse_args().combine,
+                                   arg_parser.parse_args().retention, spill_prefix,
+                                   arg_parser.parse_args().baseline_half_life, arg_parser.parse_args().envelope)
+    except ValueError as e:
+        print(e)
+        flow.stop()
+        return
+    get_input = flow.get_user_input if CHANNELS is None else flow.get_board_input
+    latency = LatencyTracker()
+    scene.latency = latency
+    profiler = FrameProfiler(target_fps=arg_parser.parse_args().fps)
+    scene.profiler = profiler
+    
+    publisher = None
+    stream_name = arg_parser.parse_args().publish
+    if stream_name is None and arg_parser.parse_args().dashboard:
+        stream_name = DEFAULT_NAME
+    if stream_name is not None:
+        try:
+            publisher = StreamPublisher(stream_name, sampling_rate=emg_filter.fs)
+        except FileExistsError as e:
+            print(e)
+            emg_filter.close()
+            flow.stop()
+            return
+    if arg_parser.parse_args().dashboard:
+        # The dashboard exits by itself when the stream is closed
+        subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "dashboard.py"),
+                          "--name", stream_name])
+    
+    # At most one crossing per step of the game, the penalty after a hit is enforced by the game itself
+    acquisition = None
+    if arg_parser.parse_args().threaded:
+        acquisition = Acquisition(get_input, emg_filter, flow.get_timestamps, latency=latency, publisher=publisher,
+                                  refractory=STEP)
+        acquisition.start()
+    else:
+        detector = CrossingDetector(emg_filter.fs, refractory=STEP)
     
     clock = pygame.time.Clock()
     running = True
-    while running:
-        emg = flow.get_user_input()
-        
-        if emg is not None:
-            for sample in emg:
-                emg_filter.apply(sample)
-        if type(scene) == GameScene:
-            adapt_threshold(scene, emg_filter)
+    try:
+        while running:
+            profiler.begin()
+            if acquisition is None:
+                emg = get_input()
+                profiler.mark("poll")
+            
+                output = None
+                timestamps = None
+                if emg is not None:
+                    timestamps = flow.get_timestamps()
+                    latency.samples("acquired", timestamps)
+                    output = emg_filter.apply_block(emg)
+                if type(scene) == GameScene:
+                    adapt_threshold(scene, emg_filter)
+                crossings = []
+                if output is not None:
+                    latency.block("filtered", timestamps)
+                    crossings = detect_crossings(detector, output, timestamps, emg_filter)
+                    if publisher is not None:
+                        publish(publisher, emg_filter, output, timestamps)
+            
+                try:
+                    last_sample = emg_filter.output[-1]
+                except:
+                    last_sample = None
+                profiler.mark("filter")
+            else:
+                snapshot = acquisition.read()
+                if type(scene) == GameScene:
+                    acquisition.phase = scene.current_phase
+                    if snapshot.threshold is not None:
+                        scene.set_threshold(snapshot.threshold)
+                last_sample = snapshot.envelope
+                crossings = acquisition.read_crossings()
+                profiler.mark("poll")
         
-        for event in pygame.event.get():
-            # Did the user click the window close button?
-            if event.type == pygame.QUIT:
-                running = False
-            # Did the user press Q?
-            elif event.type == pygame.KEYDOWN and event.key == pygame.K_q:
-                running = False
-            # Did the user press F?
-            elif event.type == pygame.KEYDOWN and event.key == pygame.K_f:
-                pygame.display.toggle_fullscreen()
-            scene.process_event(event)
+            for event in pygame.event.get():
+                # Did the user click the window close button?
+                if event.type == pygame.QUIT:
+                    running = False
+                # Did the user press Q?
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_q:
+                    running = False
+                # Did the user press F?
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_f:
+                    pygame.display.toggle_fullscreen()
+                # Did the user press H?
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_h:
+                    profiler.visible = not profiler.visible
+                scene.process_event(event)
         
-        try:
-            last_sample = emg_filter.output[-1]
-        except:
-            last_sample = None
-        scene.draw(screen, last_sample)
-        clock.tick(60)
-
-    plt.plot([el / flow.get_sample_rate() for el in range(100, len(emg_filter.output))],
-             emg_filter.output[100:])  # Skip the first 100 samples because they are noisy
-    plt.savefig(f"logs/{datetime.utcnow().strftime('%Y-%m-%d-%H-%M-%S')}_{arg_parser.parse_args().mode}.png",
-                format="png")
-    plt.xlabel("Time / s")
-    plt.ylabel("Amplitude")
-    plt.show()
-
-    plt.plot([el / flow.get_sample_rate() for el in range(len(emg_filter.input))], emg_filter.input)
-    plt.xlabel("Time / s")
-    plt.ylabel("Amplitude")
-    plt.show()
+            for crossing in crossings:
+                if scene.process_crossing(crossing):
+                    latency.event(crossing.timestamp)
+            if publisher is not None:
+                publisher.set_phase(scene.current_phase)
+            profiler.mark("events")
+            scene.draw(screen, last_sample)
+            clock.tick(arg_parser.parse_args().fps)
+            profiler.mark("wait")
+            profiler.end()
+    finally:
+        if acquisition is not None:
+            acquisition.stop()
+        if publisher is not None:
+            publisher.close()
+        if flow.poll_limit is not None or flow.recorder is not None:
+            # A binary recording only gets the samples that were polled
+            scene.log("PollOverruns", flow.overruns)
+        if flow.poll_limit is not None:
+            scene.log("PollBacklog", flow.backlog)
+        latency.log(scene)
+        profiler.log(scene)
+
+        # Release the board before the plots are prepared
+        flow.stop()
+
+        if running:
+            # The loop ended with an error, which is raised once the logs are flushed
+            emg_filter.close()
+            scene.close()
+            pygame.quit()
     
-    flow.stop()
+    output = emg_filter.output.history()
+    output_start = max(emg_filter.output.history_start, 100)  # Skip the first 100 samples because they are noisy
+    output = output[output_start - emg_filter.output.history_start:]
+    prefix = f"logs/{datetime.utcnow().strftime('%Y-%m-%d-%H-%M-%S')}_{arg_parser.parse_args().mode}"
+    plots = [
+        (report.decimate_minmax(output, output_start, emg_filter.fs), f"{prefix}.png", "Filtered"),
+        (report.decimate_minmax(emg_filter.input.history(), emg_filter.input.history_start, emg_filter.fs),
+         f"{prefix}-input.png", "Input"),
+    ]
+    emg_filter.close()
+    report.export(plots)
+
+    scene.close()
     pygame.quit()
+    if arg_parser.parse_args().show_plots:
+        report.show(plots)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,137 @@
+import time
+
+import numpy as np
+import pygame
+
+import constants
+from ring_buffer import RingBuffer
+
+STAGES = ("poll", "filter", "events", "draw", "flip", "wait")
+
+
+class FrameProfiler:
+    """
+    Times the stages of every frame of the main loop and counts the late and the dropped frames. The durations of the
+    last frames are kept in a ring buffer for the HUD overlay, the totals cover the whole session.
+    """
+
+    def __init__(self, target_fps: int = 60, capacity: int = 600, late_factor: float = 1.5,
+                 hud_interval: float = 0.5):
+        """
+        :param target_fps: Frame rate the main loop is supposed to run at
+        :param capacity: Number of frames kept in the rolling buffer
+        :param late_factor: A frame is late if it takes longer than this many target frame times
+        :param hud_interval: Seconds between two updates of the HUD text
+        """
+        self.target = 1 / target_fps
+        self.late_factor = late_factor
+        self.hud_interval = hud_interval
+        self.visible = False
+
+        # Durations of the stages, followed by the whole frame, in seconds
+        self.frames = RingBuffer(capacity, shape=(len(STAGES) + 1,))
+        self.frame_count = 0
+        self.late = 0
+        self.dropped = 0
+        self._sum = np.zeros(len(STAGES) + 1)
+        self._max = np.zeros(len(STAGES) + 1)
+
+        self._current = np.zeros(len(STAGES) + 1)
+        self._mark = None
+        self._frame_end = None
+
+        self._font = None
+        self._hud = None
+        self._hud_updated = None
+        self._hud_rect = pygame.Rect(0, 0, 0, 0)
+
+    def begin(self):
+        self._current[:] = 0
+        self._mark = time.perf_counter()
+        if self._frame_end is None:
+            self._frame_end = self._mark
+
+    def mark(self, stage: str):
+        """
+        Adds the time since the previous mark to the stage.
+        """
+        if self._mark is None:
+            return
+        now = time.perf_counter()
+        self._current[STAGES.index(stage)] += now - self._mark
+        self._mark = now
+
+    def end(self):
+        if self._mark is None:
+            return
+        now = time.perf_counter()
+        # The frame lasts from the end of the previous frame, so that time spent outside the stages is included
+        self._current[-1] = now - self._frame_end
+        self._frame_end = now
+        self._mark = None
+
+        self.frames.append(self._current)
+        self.frame_count += 1
+        self._sum += self._current
+        np.maximum(self._max, self._current, out=self._max)
+        if self._current[-1] > self.target * self.late_factor:
+            self.late += 1
+            self.dropped += max(int(round(self._current[-1] / self.target)) - 1, 0)
+
+    def fps(self):
+        """
+        :return: Frame rate over the rolling buffer
+        """
+        retained = min(len(self.frames), self.frames.capacity)
+        if retained == 0:
+            return 0.0
+        return retained / self.frames.last(retained)[-1].sum()
+
+    def draw_hud(self, screen):
+        """
+        Draws the HUD in the top left corner on an opaque background, so that it can be redrawn in place every frame.
+        :return: Rectangle of the HUD
+        """
+        now = time.perf_counter()
+        if self._hud is None or now - self._hud_updated > self.hud_interval:
+            if self._font is None:
+                self._font = pygame.font.SysFont('Arial', 14)
+            retained = min(len(self.frames), self.frames.capacity)
+            means = self.frames.last(retained).mean(axis=-1) * 1000 if retained else np.zeros(len(STAGES) + 1)
+            lines = [f"{self.fps():.1f} fps  {means[-1]:.1f} ms  late {self.late}  dropped {self.dropped}",
+                     "  ".join(f"{stage} {mean:.1f}" for stage, mean in zip(STAGES, means))]
+            surfaces = [self._font.render(line, True, constants.TEXT) for line in lines]
+            self._hud = pygame.Surface((max(surface.get_width() for surface in surfaces) + 8,
+                                        sum(surface.get_height() for surface in surfaces) + 8))
+            self._hud.fill(constants.BACKGROUND)
+            y = 4
+            for surface in surfaces:
+                self._hud.blit(surface, (4, y))
+                y += surface.get_height()
+            self._hud_updated = now
+            # Never shrink, the background covers whatever a longer text left behind
+            self._hud_rect.union_ip(self._hud.get_rect())
+
+        screen.fill(constants.BACKGROUND, self._hud_rect)
+        screen.blit(self._hud, (0, 0))
+        return pygame.Rect(self._hud_rect)
+
+    def summary(self):
+        """
+        :return: Dictionary with the frame rate, the late and the dropped frames, and the mean and maximum duration of
+        every stage in milliseconds
+        """
+        summary = {"frames": self.frame_count, "late": self.late, "dropped": self.dropped}
+        if self.frame_count:
+            means = self._sum / self.frame_count
+            summary["fps"] = round(1 / means[-1], 1)
+            for stage, mean, maximum in zip(STAGES + ("frame",), means * 1000, self._max * 1000):
+                summary[f"{stage}_mean"] = round(mean, 2)
+                summary[f"{stage}_max"] = round(maximum, 2)
+        return summary
+
+    def log(self, scene):
+        """
+        Writes the summary to the interaction log of the scene.
+        """
+        scene.log("FrameStats", " ".join(f"{key}={value}" for key, value in self.summary().items()))
@@ -0,0 +1,85 @@
+import bisect
+import itertools
+import json
+import random
+from collections import namedtuple
+
+import constants
+
+NOT_RUNNING = "Not running"
+PREPARE = "Forbered dig på bevægelse"
+MOTOR_TASK = "Bevæg håndledet"
+RELAX = "Slap af"
+
+# Instruction, colour of the bar and whether the bar is shown, for the phases the interface knows
+PHASE_STYLES = {
+    "Prepare": (PREPARE, constants.YELLOW, False),  # too short for a bar
+    "MotorTask": (MOTOR_TASK, constants.BLUE, True),
+    "Relax": (RELAX, constants.GREEN, True),
+}
+
+Phase = namedtuple("Phase", ["name", "duration", "text", "colour", "bar"])
+
+
+def create_phase(name: str, duration: float, text: str = None):
+    """
+    :param name: Name of the phase as logged, e.g. "MotorTask"
+    :param duration: Duration in seconds
+    :param text: Instruction to show, defaults to the instruction of the phase
+    """
+    default_text, colour, bar = PHASE_STYLES.get(name, (name, constants.HIGHLIGHT, True))
+    return Phase(name, float(duration), text if text is not None else default_text, colour, bar)
+
+
+class Protocol:
+    """
+    A sequence of phases with their start times computed once, so that finding the phase at a point in time is a
+    binary search no matter how long the protocol is.
+    """
+
+    def __init__(self, phases):
+        """
+        :param phases: List of `Phase`s in the order they run
+        """
+        self.phases = list(phases)
+        self.starts = [0.0] + list(itertools.accumulate(phase.duration for phase in self.phases))
+        self.duration = self.starts[-1]
+
+    def __len__(self):
+        return len(self.phases)
+
+    def phase_at(self, elapsed: float):
+        """
+        :param elapsed: Seconds since the start of the protocol
+        :return: `Phase` and the seconds left in it, or None before the start and after the end
+        """
+        if elapsed < 0 or elapsed >= self.duration:
+            return None
+        i = bisect.bisect_right(self.starts, elapsed) - 1
+        return self.phases[i], self.starts[i + 1] - elapsed
+
+    @classmethod
+    def default(cls, no_attempts: int = 5, prepare_phase: float = 2, motor_task_phase: float = 5,
+                relax_phase: float = 5):
+        """
+        :return: `no_attempts` times Prepare, MotorTask and Relax
+        """
+        trial = [create_phase("Prepare", prepare_phase), create_phase("MotorTask", motor_task_phase),
+                 create_phase("Relax", relax_phase)]
+        return cls(trial * no_attempts)
+
+
+def load_protocol(path: str):
+    """
+    Loads a protocol from a JSON file like
+    `{"trials": [[["Prepare", 2], ["MotorTask", 5], ["Relax", 5]]], "repeat": 100, "shuffle": true, "seed": 1}`.
+    Every trial is a list of `[name, seconds]` or `[name, seconds, text]`. The trials are repeated `repeat` times
+    and, if `shuffle` is set, the order of the trials is randomised with the optional `seed`.
+    :return: `Protocol`
+    """
+    with open(path) as f:
+        spec = json.load(f)
+    trials = [[create_phase(*phase) for phase in trial] for trial in spec["trials"]] * spec.get("repeat", 1)
+    if spec.get("shuffle", False):
+        random.Random(spec.get("seed")).shuffle(trials)
+    return Protocol(itertools.chain.from_iterable(trials))
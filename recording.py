@@ -0,0 +1,199 @@
+import argparse
+import itertools
+import json
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b"BCIREC01"
+EXTENSION = ".bcirec"
+ALIGNMENT = 64
+
+
+def read_chunks(path: str, chunk_size: int = 250 * 60):
+    """
+    Reads a recording in chunks, either a tab-separated file recorded with BrainFlow or a binary recording.
+    :param path: Path of the file
+    :param chunk_size: Number of samples per chunk
+    :return: Generator of chunks of the board data (channels x samples)
+    """
+    if path.endswith(EXTENSION):
+        reader = RecordingReader(path)
+        for start in range(0, len(reader), chunk_size):
+            yield reader.board_data(start, start + chunk_size)
+        return
+
+    with open(path) as f:
+        while True:
+            lines = list(itertools.islice(f, chunk_size))
+            if not lines:
+                return
+            yield np.loadtxt(lines, delimiter="\t", ndmin=2).T
+
+
+def _record_dtype(channels, dtype):
+    return np.dtype([("data", dtype, (channels,)), ("timestamp", "<f8")])
+
+
+class Recorder:
+    """
+    Writes board data to a compact binary file: a JSON header followed by fixed-size records, each holding one sample
+    of every row of the board plus the BrainFlow timestamp as float64. Samples are buffered and written in chunks.
+    """
+
+    def __init__(self, path: str, channels: int = 24, timestamp_row: int = 22, sampling_rate: int = 250,
+                 dtype: str = "float32", chunk_size: int = 250 * 4, metadata: dict = None):
+        """
+        :param path: Path of the file to write
+        :param channels: Number of rows of the board data
+        :param timestamp_row: Row of the board data with the BrainFlow timestamp
+        :param sampling_rate: Sampling rate in Hz
+        :param dtype: Data type to store the rows with, "float32" or "float64"
+        :param chunk_size: Number of samples buffered before they are written
+        :param metadata: Additional information to store in the header
+        """
+        self.path = path
+        self.channels = channels
+        self.timestamp_row = timestamp_row
+        self.record_dtype = _record_dtype(channels, dtype)
+        self.chunk_size = chunk_size
+
+        self._buffer = np.zeros(chunk_size, dtype=self.record_dtype)
+        self._buffered = 0
+        self.samples = 0
+
+        header = json.dumps({"channels": channels, "dtype": np.dtype(dtype).str, "timestamp_row": timestamp_row,
+                             "sampling_rate": sampling_rate, "metadata": metadata or {}}).encode()
+        # Pad the header so that the records start aligned
+        length = len(MAGIC) + 4 + len(header)
+        header += b" " * (-length % ALIGNMENT)
+
+        self.f = open(path, "wb")
+        self.f.write(MAGIC + struct.pack("<I", len(header)) + header)
+
+    def write(self, data):
+        """
+        :param data: Board data as returned by `get_board_data()` (channels x samples)
+        """
+        n = data.shape[-1]
+        written = 0
+        while written < n:
+            count = min(n - written, self.chunk_size - self._buffered)
+            records = self._buffer[self._buffered:self._buffered + count]
+            records["data"] = data[:, written:written + count].T
+            records["timestamp"] = data[self.timestamp_row, written:written + count]
+            self._buffered += count
+            written += count
+            if self._buffered == self.chunk_size:
+                self.flush()
+        self.samples += n
+
+    def flush(self):
+        self.f.write(self._buffer[:self._buffered].tobytes())
+        self.f.flush()
+        self._buffered = 0
+
+    def close(self):
+        if self.f.closed:
+            return
+        self.flush()
+        self.f.close()
+
+
+class RecordingReader:
+    """
+    Memory-maps a binary recording. Rows and time ranges are returned as views of the file without copying.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"Not a binary recording: {path}")
+            (length,) = struct.unpack("<I", f.read(4))
+            self.header = json.loads(f.read(length))
+
+        self.channels = self.header["channels"]
+        self.timestamp_row = self.header["timestamp_row"]
+        self.sampling_rate = self.header["sampling_rate"]
+        self.record_dtype = _record_dtype(self.channels, self.header["dtype"])
+
+        offset = len(MAGIC) + 4 + length
+        # A recording that was interrupted may end with an incomplete record
+        samples = (os.path.getsize(path) - offset) // self.record_dtype.itemsize
+        if samples > 0:
+            self.records = np.memmap(path, dtype=self.record_dtype, mode="r", offset=offset, shape=(samples,))
+        else:
+            self.records = np.zeros(0, dtype=self.record_dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def timestamps(self):
+        """
+        :return: Full precision BrainFlow timestamps of the samples
+        """
+        return self.records["timestamp"]
+
+    def channel(self, row: int, start: int = None, stop: int = None):
+        """
+        :return: View of one row of the board data between the given samples
+        """
+        return self.records["data"][start:stop, row]
+
+    def board_data(self, start: int = None, stop: int = None):
+        """
+        :return: View of the board data (channels x samples) between the given samples, like `get_board_data()`
+        """
+        return self.records["data"][start:stop].T
+
+    def time_range(self, start: float = None, stop: float = None):
+        """
+        :param start: BrainFlow timestamp of the first sample, defaults to the start of the recording
+        :param stop: BrainFlow timestamp after the last sample, defaults to the end of the recording
+        :return: First and last (exclusive) sample between the timestamps
+        """
+        timestamps = self.timestamps
+        first = 0 if start is None else int(np.searchsorted(timestamps, start, side="left"))
+        last = len(timestamps) if stop is None else int(np.searchsorted(timestamps, stop, side="left"))
+        return first, last
+
+
+def convert_csv(path: str, output: str = None, dtype: str = "float32", sampling_rate: int = 250,
+                timestamp_row: int = 22, chunk_size: int = 250 * 60):
+    """
+    Converts a tab-separated file recorded with BrainFlow to a binary recording.
+    :return: Path of the binary recording
+    """
+    if output is None:
+        output = os.path.splitext(path)[0] + EXTENSION
+    recorder = None
+    for chunk in read_chunks(path, chunk_size):
+        if recorder is None:
+            recorder = Recorder(output, channels=chunk.shape[0], timestamp_row=timestamp_row,
+                                sampling_rate=sampling_rate, dtype=dtype, chunk_size=chunk_size,
+                                metadata={"source": os.path.basename(path)})
+        recorder.write(chunk)
+    if recorder is None:
+        raise ValueError(f"Empty recording: {path}")
+    recorder.close()
+    return output
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Convert BrainFlow recordings to binary recordings")
+    arg_parser.add_argument("files", nargs="+", help="The .csv files to convert")
+    arg_parser.add_argument("--dtype", choices=["float32", "float64"], default="float32",
+                            help="Data type of the samples. Default is float32")
+    arg_parser.add_argument("--sampling-rate", type=int, default=250, help="Sampling rate in Hz. Default is 250")
+    args = arg_parser.parse_args()
+
+    for path in args.files:
+        output = convert_csv(path, dtype=args.dtype, sampling_rate=args.sampling_rate)
+        print(f"{path} -> {output} ({os.path.getsize(path) / 1e6:.1f} MB -> {os.path.getsize(output) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import argparse
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from acquisition import update_baseline, get_threshold, detect_crossings
+from crossing import CrossingDetector
+from envelope import DETECTORS
+from filter import Filter, FilterBank
+from game_state import STEP, TICK_RATE, GameState
+from level import EndlessLevel
+from recording import read_chunks
+
+ReplayResult = namedtuple("ReplayResult", ["sampling_rate", "envelope", "thresholds", "baselines", "jumps", "hits",
+                                           "phases"])
+
+
+class Replay:
+    """
+    Runs a recording through the filter and the threshold logic of the game as fast as possible. The game is the
+    `GameState` that `GameScene` draws, stepped on a simulated clock instead of the wall clock, so the phases and
+    jumps happen when they would have happened live.
+    """
+
+    def __init__(self, emg_filter: Filter, channel: int = 1, level=None, start: float = 0):
+        """
+        :param emg_filter: `Filter` or `FilterBank` to run the recording through
+        :param channel: Row of the board data to filter if `emg_filter` is a single channel `Filter`
+        :param level: Level to play, defaults to the level of `GameScene`
+        :param start: Second of the recording at which the player presses start
+        """
+        self.emg_filter = emg_filter
+        self.channel = channel
+        self.game = GameState(level, log=self._record)
+        self.game.started = True
+        self.start = start
+        self.jumps = []
+        self.hits = []
+        self.phases = []
+
+    def _record(self, type_, value, timestamp=None):
+        t = self.game.ticks / 1000
+        if type_ == "PlayerJump":
+            self.jumps.append(t)
+        elif type_ == "PlayerHit":
+            self.hits.append(t)
+        elif type_ == "Phase":
+            self.phases.append((t, value))
+
+    def run(self, chunks):
+        """
+        :param chunks: Iterable of chunks of the board data (channels x samples), e.g. from `read_chunks`
+        :return: `ReplayResult` with the envelope, the threshold trajectory, the baselines, the jumps, the hits and the
+        phases
+        """
+        fs = self.emg_filter.fs
+        game = self.game
+        detector = CrossingDetector(fs, refractory=STEP)
+        envelope = []
+        thresholds = []
+        baselines = []
+        frame = 0
+        filtered = 0
+        detected = 0  # no. of samples passed to the crossing detector
+        last_sample = None
+        for chunk in chunks:
+            if isinstance(self.emg_filter, FilterBank):
+                output = self.emg_filter.apply_block(chunk)
+            else:
+                output = self.emg_filter.apply_block(chunk[self.channel])
+            envelope.append(output)
+            filtered += len(output)
+
+            # Step every frame whose samples have all been filtered
+            while True:
+                t = self.start + frame / TICK_RATE
+                available = int(t * fs) + 1
+                if available > filtered:
+                    break
+                update_baseline(game.current_phase, self.emg_filter, available)
+                threshold = get_threshold(self.emg_filter)
+                if threshold is not None:
+                    if threshold != game.threshold:
+                        thresholds.append((t, threshold))
+                        baselines.append((t, self.emg_filter.baseline, self.emg_filter.baseline_std))
+                    game.set_threshold(threshold)
+                offset = filtered - len(output)
+                block = output[max(detected - offset, 0):available - offset]
+                # Crossings are handled before the step, like in the main loop
+                for crossing in detect_crossings(detector, block, None, self.emg_filter):
+                    game.process_crossing(crossing)
+                if len(block):
+                    last_sample = block[-1]
+                game.process_envelope(last_sample)
+                game.step()
+                detected = available
+                frame += 1
+
+        # Times of the simulated clock are relative to the start of the game, report them relative to the recording
+        shift = self.start
+        return ReplayResult(
+            sampling_rate=fs,
+            envelope=np.concatenate(envelope) if envelope else np.zeros(0),
+            thresholds=thresholds,
+            baselines=baselines,
+            jumps=[t + shift for t in self.jumps],
+            hits=[t + shift for t in self.hits],
+            phases=[(t + shift, phase) for t, phase in self.phases],
+        )
+
+
+def replay_file(path: str, sampling_rate: int = 250, channel: int = 1, bandpass_low: int = 30,
+                bandpass_high: int = 45, mean_kernel_size: int = None, start: float = 0, chunk_size: int = 250 * 60,
+                envelope: str = None, endless: bool = False, jitter: int = 0, seed=None):
+    """
+    Replays a file recorded with BrainFlow, or a binary recording, through `Filter` and the simulated game.
+    :param endless: Play an `EndlessLevel` with the given `jitter` and `seed` instead of the level of `GameScene`
+    :return: `ReplayResult`
+    """
+    # Keep a whole chunk and the baseline window in memory
+    emg_filter = Filter(sampling_frequency=sampling_rate, bandpass_low=bandpass_low, bandpass_high=bandpass_high,
+                        mean_kernel_size=mean_kernel_size, retention=chunk_size / sampling_rate + 10,
+                        envelope=envelope)
+    level = EndlessLevel(jitter=jitter, seed=seed) if endless else None
+    return Replay(emg_filter, channel=channel, level=level, start=start).run(read_chunks(path, chunk_size))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Replay a BrainFlow recording without a window")
+    arg_parser.add_argument("file", help="The file to replay")
+    arg_parser.add_argument("--channel", type=int, default=1, help="no. of the EMG channel. Default is 1")
+    arg_parser.add_argument("--sampling-rate", type=int, default=250, help="Sampling rate in Hz. Default is 250")
+    arg_parser.add_argument("--bandpass-low", type=int, default=30, help="Low cut in Hz. Default is 30")
+    arg_parser.add_argument("--bandpass-high", type=int, default=45, help="High cut in Hz. Default is 45")
+    arg_parser.add_argument("--kernel", type=int, default=None,
+                            help="Size of the mean filter kernel in samples. Default is a third of a second")
+    arg_parser.add_argument("--envelope", choices=list(DETECTORS), default=None,
+                            help="Envelope detector to use instead of the mean filter, see envelope.py")
+    arg_parser.add_argument("--start", type=float, default=0,
+                            help="Second of the recording at which the game starts. Default is 0")
+    arg_parser.add_argument("--endless", action="store_true", default=False,
+                            help="Play an endless level until the recording ends")
+    arg_parser.add_argument("--jitter", type=int, default=0,
+                            help="Tiles the distance between the obstacles of --endless varies by. Default is 0")
+    arg_parser.add_argument("--seed", type=int, default=None, help="Seed of the --jitter")
+    arg_parser.add_argument("--output", default=None, help="Save the results to this .npz file")
+    args = arg_parser.parse_args()
+    if args.jitter < 0:
+        arg_parser.error("--jitter must not be negative")
+
+    started = time.perf_counter()
+    result = replay_file(args.file, sampling_rate=args.sampling_rate, channel=args.channel,
+                         bandpass_low=args.bandpass_low, bandpass_high=args.bandpass_high,
+                         mean_kernel_size=args.kernel, start=args.start, envelope=args.envelope,
+                         endless=args.endless, jitter=args.jitter, seed=args.seed)
+    elapsed = time.perf_counter() - started
+
+    duration = len(result.envelope) / result.sampling_rate
+    print(f"Replayed {duration:.1f} s of data in {elapsed:.2f} s ({duration / max(elapsed, 1e-9):.0f}x real time)")
+    for t, phase in result.phases:
+        print(f"{t:8.2f} s  Phase {phase}")
+    for t, threshold in result.thresholds:
+        print(f"{t:8.2f} s  Threshold {threshold:.3f}")
+    for t in result.jumps:
+        print(f"{t:8.2f} s  PlayerJump")
+    for t in result.hits:
+        print(f"{t:8.2f} s  PlayerHit")
+
+    if args.output:
+        np.savez(args.output, envelope=result.envelope,
+                 threshold_time=np.array([t for t, _ in result.thresholds]),
+                 threshold=np.array([threshold for _, threshold in result.thresholds]),
+                 jump_time=np.array(result.jumps), hit_time=np.array(result.hits),
+                 phase_time=np.array([t for t, _ in result.phases]),
+                 phase=np.array([phase for _, phase in result.phases]))
+
+
+if __name__ == "__main__":
+    main()
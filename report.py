@@ -0,0 +1,96 @@
+import multiprocessing
+from collections import namedtuple
+
+import numpy as np
+
+# A signal ready to plot: times in seconds and values with time on the last axis
+Trace = namedtuple("Trace", ["time", "values"])
+
+
+def decimate_minmax(values, start: int, sampling_rate: int, width: int = 2000, chunk_bins: int = 4096):
+    """
+    Reduces a signal to the minimum and the maximum of each of `width` bins, which looks the same as the full signal
+    when drawn `width` pixels wide. Works through memory-mapped histories in chunks without loading them at once.
+    :param values: Signal with time on the last axis
+    :param start: Absolute index of the first sample
+    :param sampling_rate: Sampling rate in Hz
+    :param width: Number of bins, e.g. the width of the plot in pixels
+    :param chunk_bins: Number of bins reduced at once
+    :return: `Trace` with two points per bin
+    """
+    n = values.shape[-1]
+    if n <= 2 * width:
+        return Trace((start + np.arange(n)) / sampling_rate, np.array(values))
+
+    size = -(-n // width)  # samples per bin
+    bins = -(-n // size)
+    lows = np.empty(values.shape[:-1] + (bins,), dtype=values.dtype)
+    highs = np.empty_like(lows)
+    for first in range(0, bins, chunk_bins):
+        last = min(first + chunk_bins, bins)
+        chunk = np.asarray(values[..., first * size:last * size])
+        full = (chunk.shape[-1] // size) * size
+        blocks = chunk[..., :full].reshape(chunk.shape[:-1] + (-1, size))
+        lows[..., first:first + blocks.shape[-2]] = blocks.min(axis=-1)
+        highs[..., first:first + blocks.shape[-2]] = blocks.max(axis=-1)
+        if full < chunk.shape[-1]:
+            # The last bin is shorter
+            lows[..., last - 1] = chunk[..., full:].min(axis=-1)
+            highs[..., last - 1] = chunk[..., full:].max(axis=-1)
+
+    time = np.repeat((start + np.arange(bins) * size) / sampling_rate, 2)
+    decimated = np.stack([lows, highs], axis=-1).reshape(values.shape[:-1] + (2 * bins,))
+    return Trace(time, decimated)
+
+
+def render(trace: Trace, path: str, title: str = None, size=(10, 4), dpi: int = 100):
+    """
+    Draws a trace into an image file with the Agg renderer, without a display or pyplot.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=size, dpi=dpi)
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    axes.plot(trace.time, np.transpose(trace.values), linewidth=0.5)
+    axes.set_xlabel("Time / s")
+    axes.set_ylabel("Amplitude")
+    if title:
+        axes.set_title(title)
+    figure.tight_layout()
+    figure.savefig(path)
+
+
+def _render_all(plots):
+    for trace, path, title in plots:
+        render(trace, path, title)
+
+
+def export(plots):
+    """
+    Renders the plots in a background process, so that the caller can shut down without waiting for matplotlib.
+    The interpreter still waits for the process to finish before it exits.
+    :param plots: List of `(trace, path, title)`
+    :return: The started process
+    """
+    # A fresh interpreter does not inherit the display, the board session or the threads of the caller
+    process = multiprocessing.get_context("spawn").Process(target=_render_all, args=(plots,), name="report")
+    process.start()
+    return process
+
+
+def show(plots):
+    """
+    Shows the plots in interactive windows, one after another.
+    """
+    import matplotlib.pyplot as plt
+
+    for trace, _, title in plots:
+        plt.figure()
+        plt.plot(trace.time, np.transpose(trace.values), linewidth=0.5)
+        plt.xlabel("Time / s")
+        plt.ylabel("Amplitude")
+        if title:
+            plt.title(title)
+        plt.show()
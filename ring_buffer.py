@@ -0,0 +1,130 @@
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Preallocated NumPy ring buffer that keeps the last `capacity` samples along the last axis.
+
+    Every value is written twice (at `i` and `i + capacity`), so the retained window is always readable as one
+    contiguous view without copying. Indices are absolute, i.e. they count every sample ever appended, which lets
+    callers keep using `len(buffer)` and slices like they would with a list.
+    """
+
+    def __init__(self, capacity: int, shape: tuple = (), dtype=np.float64, spill_path: str = None):
+        """
+        :param capacity: Number of most recent samples to retain in memory
+        :param shape: Shape of the leading axes, e.g. `(channels,)` for multichannel data
+        :param dtype: Data type of the samples
+        :param spill_path: If set, every appended sample is also written to this file to capture the full history
+        """
+        self.capacity = int(capacity)
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self._data = np.zeros(self.shape + (2 * self.capacity,), dtype=self.dtype)
+        self._count = 0
+
+        self.spill_path = spill_path
+        self._spill = open(spill_path, "wb") if spill_path else None
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def start(self):
+        """
+        :return: Absolute index of the oldest sample still held in memory
+        """
+        return max(0, self._count - self.capacity)
+
+    def append(self, values):
+        """
+        :param values: A single sample or a block of samples with time on the last axis
+        """
+        values = np.asarray(values, dtype=self.dtype)
+        if values.ndim == len(self.shape):
+            values = values[..., np.newaxis]
+        n = values.shape[-1]
+        if n == 0:
+            return
+
+        if self._spill is not None:
+            # Time-major on disk so that the file can be read back as a `(samples, *shape)` array
+            self._spill.write(np.ascontiguousarray(np.moveaxis(values, -1, 0)).tobytes())
+
+        count = self._count
+        self._count += n
+        # Older samples of a block larger than the buffer would be overwritten straight away
+        if n > self.capacity:
+            count += n - self.capacity
+            values = values[..., -self.capacity:]
+            n = self.capacity
+
+        start = count % self.capacity
+        first = min(n, self.capacity - start)
+        rest = n - first
+        for offset in (0, self.capacity):
+            self._data[..., offset + start:offset + start + first] = values[..., :first]
+            if rest:
+                self._data[..., offset:offset + rest] = values[..., first:]
+
+    def last(self, n: int):
+        """
+        :return: Contiguous view of the last `n` retained samples
+        """
+        n = min(n, self._count, self.capacity)
+        end = self._count % self.capacity + self.capacity
+        return self._data[..., end - n:end]
+
+    def view(self):
+        """
+        :return: Contiguous view of all the samples held in memory
+        """
+        return self.last(self.capacity)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(self._count)
+            if step != 1:
+                return self[start:stop][..., ::step]
+            # Samples that have already left the buffer are silently dropped, like list slicing past the end
+            start = max(start, self.start)
+            stop = max(stop, start)
+            end = self._count % self.capacity + self.capacity
+            return self._data[..., end - (self._count - start):end - (self._count - stop)]
+
+        index = int(item)
+        if index < 0:
+            index += self._count
+        if not self.start <= index < self._count:
+            raise IndexError(f"Sample {item} is not retained in the buffer")
+        end = self._count % self.capacity + self.capacity
+        return self._data[..., end - (self._count - index)]
+
+    def __array__(self, dtype=None, copy=None):
+        view = self.view()
+        return view.astype(dtype) if dtype is not None else view
+
+    @property
+    def history_start(self):
+        """
+        :return: Absolute index of the first sample returned by `history()`
+        """
+        return 0 if self.spill_path else self.start
+
+    def history(self):
+        """
+        :return: The full history from the spill file if spilling is enabled, otherwise the retained samples
+        """
+        if not self.spill_path:
+            return self.view()
+        if self._spill is not None:
+            self._spill.flush()
+        if self._count == 0:
+            return np.zeros(self.shape + (0,), dtype=self.dtype)
+        data = np.memmap(self.spill_path, dtype=self.dtype, mode="r", shape=(self._count,) + self.shape)
+        return np.moveaxis(data, 0, -1)
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
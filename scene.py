@@ -1,24 +1,57 @@
 from datetime import datetime
 
+import pygame
+
+from interaction_log import InteractionLog
+
 
 class Scene:
+    current_phase = None  # name of the phase of the protocol the subject is in
+
     def __init__(self):
         self.now = datetime.utcnow()
-        self.f = open(f"logs/{self.now.strftime('%Y-%m-%d-%H-%M-%S')}-interaction.csv", "w")
-        self.f.write("timestamp;type;value\n")
+        self.interaction_log = InteractionLog(f"logs/{self.now.strftime('%Y-%m-%d-%H-%M-%S')}-interaction.csv")
+        self.latency = None  # `LatencyTracker` notified when a frame is presented
+        self.profiler = None  # `FrameProfiler` timing the drawing and the flip, and drawing the HUD
 
     def __del__(self):
-        self.f.close()
+        self.close()
 
-    def log(self, type_, value, timestamp=None):
-        if timestamp is None:
-            timestamp = datetime.utcnow()
-        self.f.write(f"{timestamp};{type_};{value}\n")
-        self.f.flush()
+    def close(self):
+        self.interaction_log.close()
 
+    def log(self, type_, value, timestamp=None):
+        self.interaction_log.log(type_, value, timestamp)
 
     def draw(self, screen, emg):
         pass
 
+    def present(self, dirty=None):
+        """
+        Shows the drawn frame on the display.
+        :param dirty: Rectangles that changed since the last frame, or None to flip the whole display
+        """
+        if self.profiler is not None:
+            if self.profiler.visible:
+                rect = self.profiler.draw_hud(pygame.display.get_surface())
+                if dirty is not None:
+                    dirty = dirty + [rect]
+            self.profiler.mark("draw")
+        if dirty is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(dirty)
+        if self.profiler is not None:
+            self.profiler.mark("flip")
+        if self.latency is not None:
+            self.latency.presented()
+
     def process_event(self, event):
         pass
+
+    def process_crossing(self, crossing):
+        """
+        Called for every upward crossing of the threshold by the filtered signal.
+        :return: True if the crossing triggered feedback
+        """
+        return False
@@ -0,0 +1,255 @@
+import os
+import struct
+import time
+from collections import namedtuple
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+DEFAULT_NAME = "bci-stream"
+MAGIC = b"BCISHM01"
+FIELDS = ("envelope", "raw", "timestamp")
+PHASES = ("NotRunning", "Prepare", "Relax", "MotorTask")
+
+# Magic, capacity, sampling rate, count, phase, threshold, baseline, baseline standard deviation, closed, process id of
+# the publisher
+_HEADER = struct.Struct("<8sqqqqdddqq")
+_COUNT_OFFSET = 8 + 8 + 8
+_HEADER_SIZE = 128
+
+# Samples since the last read: absolute index of the first sample and views of the fields
+Block = namedtuple("Block", ["start", "envelope", "raw", "timestamp"])
+# Latest state of the session, None where unknown
+State = namedtuple("State", ["phase", "threshold", "baseline", "baseline_std"])
+
+
+def _layout(buffer, capacity):
+    """
+    :return: Views of the sample counter, the state, the closed flag and the samples (fields x 2 * capacity) in the
+    shared memory
+    """
+    count = np.ndarray((1,), dtype=np.int64, buffer=buffer, offset=_COUNT_OFFSET)
+    phase = np.ndarray((1,), dtype=np.int64, buffer=buffer, offset=_COUNT_OFFSET + 8)
+    values = np.ndarray((3,), dtype=np.float64, buffer=buffer, offset=_COUNT_OFFSET + 16)
+    closed = np.ndarray((1,), dtype=np.int64, buffer=buffer, offset=_COUNT_OFFSET + 40)
+    samples = np.ndarray((len(FIELDS), 2 * capacity), dtype=np.float64, buffer=buffer, offset=_HEADER_SIZE)
+    return count, phase, values, closed, samples
+
+
+def _is_running(pid: int):
+    """
+    :return: False if no process with the id runs on the machine anymore
+    """
+    if os.name == "nt":
+        # Shared memory is removed with the last process using it on Windows, an existing block is always in use
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _detach_tracker(shm):
+    """
+    Keeps the resource tracker of this process from removing a block it only attached to when the process exits.
+    A block published by this process stays registered, so the publisher can unlink it.
+    """
+    if shm.size >= _HEADER.size:
+        magic, *_, pid = _HEADER.unpack_from(shm.buf, 0)
+        if magic == MAGIC and pid == os.getpid():
+            return
+    resource_tracker.unregister(shm._name, "shared_memory")
+
+
+def _remove_stale(name: str):
+    """
+    Removes a shared memory block left behind by a publisher that closed it or is no longer running.
+    :return: True if the block was removed, False if it is still in use
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    stale = False
+    if shm.size >= _HEADER.size:
+        magic, *_, closed, pid = _HEADER.unpack_from(shm.buf, 0)
+        stale = magic == MAGIC and (closed or (pid > 0 and not _is_running(pid)))
+    if not stale:
+        _detach_tracker(shm)
+    shm.close()
+    if stale:
+        shm.unlink()
+    return stale
+
+
+class StreamPublisher:
+    """
+    Publishes the filtered envelope, the raw signal and the state of the session to a shared memory ring buffer that
+    other processes on the machine can tail with `StreamReader`. Like `RingBuffer`, every sample is written twice, so
+    readers always get contiguous views. The sample counter is only advanced after the samples are written.
+    """
+
+    def __init__(self, name: str = DEFAULT_NAME, capacity: int = 250 * 60, sampling_rate: int = 250):
+        """
+        :param name: Name of the shared memory block
+        :param capacity: Number of most recent samples readers can catch up on
+        :param sampling_rate: Sampling rate in Hz, stored for the readers
+        :raises FileExistsError: If another session publishes under the same name
+        """
+        self.name = name
+        self.capacity = int(capacity)
+        size = _HEADER_SIZE + len(FIELDS) * 2 * self.capacity * 8
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Only a block left behind by a session that crashed is replaced
+            if not _remove_stale(name):
+                raise FileExistsError(f"The stream {name} is in use by another session, publish under another name "
+                                      f"with --publish <NAME>") from None
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        _HEADER.pack_into(self.shm.buf, 0, MAGIC, self.capacity, sampling_rate, 0, -1, np.nan, np.nan, np.nan, 0,
+                          os.getpid())
+        self._count, self._phase, self._values, self._closed, self._samples = _layout(self.shm.buf, self.capacity)
+        self.count = 0
+
+    def write(self, envelope, raw=None, timestamps=None):
+        """
+        :param envelope: New samples of the filtered signal
+        :param raw: The same samples of the raw signal
+        :param timestamps: BrainFlow timestamps of the samples
+        """
+        envelope = np.asarray(envelope)
+        n = len(envelope)
+        if n == 0:
+            return
+        if n > self.capacity:
+            envelope = envelope[-self.capacity:]
+            raw = raw[-self.capacity:] if raw is not None else None
+            timestamps = timestamps[-self.capacity:] if timestamps is not None else None
+            self.count += n - self.capacity
+            n = self.capacity
+
+        block = np.full((len(FIELDS), n), np.nan)
+        block[0] = envelope
+        if raw is not None:
+            block[1] = raw
+        if timestamps is not None:
+            block[2] = timestamps
+
+        i = self.count % self.capacity
+        first = min(n, self.capacity - i)
+        for offset in (0, self.capacity):
+            self._samples[:, offset + i:offset + i + first] = block[:, :first]
+        if first < n:
+            # Wrapped around
+            for offset in (0, self.capacity):
+                self._samples[:, offset:offset + n - first] = block[:, first:]
+        self.count += n
+        self._count[0] = self.count
+
+    def set_state(self, threshold=None, baseline=None, baseline_std=None):
+        self._values[:] = [np.nan if value is None else value for value in (threshold, baseline, baseline_std)]
+
+    def set_phase(self, phase):
+        """
+        :param phase: One of `PHASES`, or None
+        """
+        self._phase[0] = PHASES.index(phase) if phase in PHASES else -1
+
+    def close(self):
+        if self.shm is None:
+            return
+        # Readers that are still attached see the stream end
+        self._closed[0] = 1
+        del self._count, self._phase, self._values, self._closed, self._samples
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+
+
+class StreamReader:
+    """
+    Tails a stream published by `StreamPublisher` from another process. The returned blocks are views of the shared
+    memory: they are valid until the publisher has written `capacity` more samples, copy them to keep them longer.
+    """
+
+    def __init__(self, name: str = DEFAULT_NAME, from_start: bool = False):
+        """
+        :param name: Name of the shared memory block
+        :param from_start: Start reading at the oldest retained sample instead of at the newest one
+        """
+        self.shm = shared_memory.SharedMemory(name=name)
+        # Only the publisher may remove the block, not the resource tracker of this process when it exits
+        _detach_tracker(self.shm)
+
+        magic, self.capacity, self.sampling_rate = _HEADER.unpack_from(self.shm.buf, 0)[:3]
+        if magic != MAGIC:
+            self.shm.close()
+            raise ValueError(f"Not a BCI stream: {name}")
+        self._count, self._phase, self._values, self._closed, self._samples = _layout(self.shm.buf, self.capacity)
+
+        count = int(self._count[0])
+        self.position = max(0, count - self.capacity) if from_start else count
+        self.dropped = 0  # no. of samples overwritten before they were read
+
+    @property
+    def count(self):
+        """
+        :return: Number of samples published so far
+        """
+        return int(self._count[0])
+
+    @property
+    def closed(self):
+        """
+        :return: True once the publisher has closed the stream
+        """
+        return bool(self._closed[0])
+
+    def read(self, max_samples: int = None):
+        """
+        :param max_samples: Maximum number of samples to return
+        :return: `Block` of the samples published since the last read
+        """
+        count = self.count
+        if count - self.position > self.capacity:
+            self.dropped += count - self.capacity - self.position
+            self.position = count - self.capacity
+        stop = count if max_samples is None else min(count, self.position + max_samples)
+        i = self.position % self.capacity
+        view = self._samples[:, i:i + stop - self.position]
+        block = Block(self.position, view[0], view[1], view[2])
+        self.position = stop
+        return block
+
+    def wait(self, timeout: float = None, interval: float = 0.001):
+        """
+        Waits until new samples are published.
+        :return: True if there are new samples, False after the timeout or if the stream was closed
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.count == self.position:
+            if self.closed or (deadline is not None and time.monotonic() >= deadline):
+                return False
+            time.sleep(interval)
+        return True
+
+    def state(self):
+        """
+        :return: Latest `State` of the session
+        """
+        phase = int(self._phase[0])
+        values = [None if np.isnan(value) else float(value) for value in self._values]
+        return State(PHASES[phase] if 0 <= phase < len(PHASES) else None, *values)
+
+    def close(self):
+        if self.shm is None:
+            return
+        del self._count, self._phase, self._values, self._closed, self._samples
+        try:
+            self.shm.close()
+        except BufferError:
+            # Blocks returned by `read` are still alive, the memory is released once they are
+            pass
+        self.shm = None